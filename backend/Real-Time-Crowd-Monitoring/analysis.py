@@ -0,0 +1,13 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))  # Ensure the main dir is included
+sys.path.append(os.path.join(os.path.dirname(__file__), "modules"))  # Add 'modules' dir to path
+
+from modules.analysis import run_analysis
+
+# Dedicated analysis process: owns the camera and the models and publishes counts,
+# flags and annotated frames to the shared state store. Start it next to any number of
+# API workers running with CROWD_EXTERNAL_ANALYSIS=1.
+if __name__ == "__main__":
+    run_analysis()
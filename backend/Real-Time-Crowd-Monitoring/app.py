@@ -1,56 +1,43 @@
 import sys
 import os
 import io
-import face_recognition
+import math
+import time
+import uuid
+import zipfile
+import numpy as np
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))  # Ensure the main dir is included
 sys.path.append(os.path.join(os.path.dirname(__file__), "modules"))  # Add 'modules' dir to path
 
 from flask import Flask, render_template, Response, jsonify, request, send_file
 from flask_cors import CORS
-from modules.crowd_detection import generate_crowd_frame, get_crowd_count, reset_crowd_count, get_weapon_status                      
-from modules.face_recog import generate_face_frame
-from modules.face_recog_advanced import generate_face_frame as generate_face_frame_advanced
-from modules import config
+# Modules are imported by their top-level names, the way they import each other (modules/
+# is on sys.path), so each is loaded once; as modules.X they would be a second copy with
+# its own process pool, publisher registry and so on
+from crowd_detection import generate_crowd_frame, get_crowd_count, reset_crowd_count, get_weapon_status
+from face_recog import generate_face_frame
+from known_faces import (
+    load_known_faces_from_folder, read_known_faces, add_known_faces, remember_encodings, safe_face_name,
+    get_pool, encode_face_image,
+)
+from enrolment import start_enrolment, get_job, read_archive
+# ("analysis" alone would be the analysis.py script next to this file; nothing else imports modules.analysis)
+from modules.analysis import start_analysis_process
+from sources import DECODE_MODES, parse_uri, source_kind
+from frame_index import FrameIndex
+from profiling import PROFILE_MODES
+from streaming import MJPEG_MIMETYPE, SSE_MIMETYPE, event_stream, get_publisher
+from heatmap import HeatmapRenderCache, read_heatmap
+import config  # Same module object the stream generators import (modules/ is on sys.path)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Flag to track whether the stream is running 
-video_stream_started = False
+# All runtime state lives in config.state, shared with the analysis process and any
+# other API worker process. Known faces are loaded by the analysis process on startup.
 
-
-def load_known_faces_from_folder():
-    """Load all known faces from the known_faces folder."""
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    known_faces_dir = os.path.join(base_dir, "modules", "Facial recognition", "known_faces")
-    
-    config.known_faces_encoding = []
-    config.known_faces_name = []
-    
-    if not os.path.exists(known_faces_dir):
-        os.makedirs(known_faces_dir, exist_ok=True)
-        return
-    
-    for filename in os.listdir(known_faces_dir):
-        if filename.lower().endswith((".jpg", ".png", ".jpeg")):
-            image_path = os.path.join(known_faces_dir, filename)
-            try:
-                image = face_recognition.load_image_file(image_path)
-                encodings = face_recognition.face_encodings(image, num_jitters=0)
-                
-                if len(encodings) > 0:
-                    config.known_faces_encoding.append(encodings[0])
-                    config.known_faces_name.append(os.path.splitext(filename)[0])
-            except Exception as e:
-                print(f"Error loading face from {filename}: {e}")
-                continue
-    
-    print(f"[INFO] Loaded {len(config.known_faces_name)} known faces: {config.known_faces_name}")
-
-
-# Load faces on startup
-load_known_faces_from_folder()
+heatmap_cache = HeatmapRenderCache(config.state)  # Heatmap images, re-rendered only when republished
 
 @app.route('/')
 def index():
@@ -58,7 +45,7 @@ def index():
 
 @app.route('/video')
 def video():
-    return Response(generate_crowd_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate_crowd_frame(), mimetype=MJPEG_MIMETYPE)
 
 @app.route('/start_crowd_count')
 def start_crowd_count():
@@ -76,35 +63,331 @@ def get_weapon_status_route():
     weapon_detected = get_weapon_status()
     return jsonify(weapon_detected=weapon_detected)
 
+@app.route('/video/<source_id>')
+def source_video(source_id):
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    return Response(generate_crowd_frame(source_id), mimetype=MJPEG_MIMETYPE)
+
+
+@app.route('/sources')
+def list_sources():
+    """Return every configured source with its health and FPS as reported by the analysis process."""
+    snapshot = config.state.snapshot(["sources", "source_health"], defaults=config.STATE_DEFAULTS)
+    specs = snapshot["sources"] or config.DEFAULT_SOURCES
+    health = snapshot["source_health"] or {}
+    return jsonify(sources={
+        source_id: dict(spec, health=health.get(source_id, {"status": "pending"}))
+        for source_id, spec in specs.items()
+    })
+
+
+@app.route('/sources', methods=['POST'])
+def add_source():
+    """Add a webcam index, video file path or RTSP URL. The analysis process starts it within a second.
+
+    JSON body: {"id": "gate-1", "uri": "rtsp://...", "decode_mode": "full"|"grab"|"keyframe"|"auto",
+    "retrieve_every": 5}. Video files also accept "speed" (1.0 = real time, 0 = every frame in
+    lockstep with the analysis), "loop" and "start" (seconds).
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object"), 400
+    source_id = str(data.get('id', '')).strip()
+    uri = data.get('uri')
+    decode_mode = data.get('decode_mode', 'full')
+
+    if not source_id or not all(c.isalnum() or c in '-_' for c in source_id):
+        return jsonify(error="Source id must be non-empty and use only letters, digits, '-' and '_'"), 400
+    if uri is None or uri == '':
+        return jsonify(error="No source uri provided"), 400
+    if not (isinstance(uri, str) or (isinstance(uri, int) and not isinstance(uri, bool) and uri >= 0)):
+        return jsonify(error="uri must be a string (file path or URL) or a webcam index"), 400
+    if decode_mode not in DECODE_MODES:
+        return jsonify(error=f"decode_mode must be one of {', '.join(DECODE_MODES)}"), 400
+
+    spec = {"uri": uri, "decode_mode": decode_mode}
+    if 'retrieve_every' in data:
+        try:
+            spec["retrieve_every"] = max(1, int(data['retrieve_every']))
+        except (TypeError, ValueError):
+            return jsonify(error="retrieve_every must be an integer"), 400
+    if source_kind(parse_uri(uri)) == "file":
+        try:
+            spec["speed"] = max(0.0, float(data.get('speed', 1.0)))
+            spec["start"] = max(0.0, float(data.get('start', 0.0)))
+        except (TypeError, ValueError):
+            return jsonify(error="speed and start must be numbers"), 400
+        if not (math.isfinite(spec["speed"]) and math.isfinite(spec["start"])):
+            return jsonify(error="speed and start must be finite"), 400
+        spec["loop"] = bool(data.get('loop', True))
+
+    def add(specs):
+        specs = dict(specs or config.DEFAULT_SOURCES)
+        if source_id in specs:
+            raise KeyError(source_id)
+        specs[source_id] = spec
+        return specs
+
+    try:
+        config.state.update("sources", add)
+    except KeyError:
+        return jsonify(error=f"Source {source_id} already exists"), 409
+    return jsonify(status="Source added", id=source_id, source=spec), 201
+
+
+@app.route('/sources/<source_id>', methods=['DELETE'])
+def remove_source(source_id):
+    """Stop and remove a source."""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    def remove(specs):
+        specs = dict(specs or config.DEFAULT_SOURCES)
+        if source_id not in specs:
+            raise KeyError(source_id)
+        del specs[source_id]
+        return specs
+
+    try:
+        config.state.update("sources", remove)
+    except KeyError:
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    return jsonify(status="Source removed", id=source_id)
+
+
+@app.route('/sources/<source_id>/seek', methods=['POST'])
+def seek_source(source_id):
+    """Jump a video file source to a time or frame. JSON body: {"seconds": 12.5} or {"frame": 300}."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    specs = config.state.get("sources") or config.DEFAULT_SOURCES
+    if source_id not in specs:
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    if source_kind(parse_uri(specs[source_id]["uri"])) != "file":
+        return jsonify(error="Only video file sources can seek"), 400
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object"), 400
+    try:
+        if 'frame' in data:
+            seek = {"frame": max(0, int(data['frame']))}
+        elif 'seconds' in data:
+            seconds = float(data['seconds'])
+            if not math.isfinite(seconds):
+                raise ValueError(seconds)
+            seek = {"seconds": max(0.0, seconds)}
+        else:
+            return jsonify(error="Provide 'seconds' or 'frame'"), 400
+    except (TypeError, ValueError, OverflowError):  # int() of an infinite float overflows
+        return jsonify(error="'seconds' and 'frame' must be finite numbers"), 400
+    seek["request"] = uuid.uuid4().hex
+
+    config.state.update("source_seek", lambda seeks: dict(seeks or {}, **{source_id: seek}))
+    return jsonify(status="Seek requested", id=source_id, **{k: v for k, v in seek.items() if k != "request"})
+
+
+@app.route('/sources/<source_id>/index')
+def source_index(source_id):
+    """Return the frame index summary (frame count, fps, duration, keyframes) of a video file source."""
+    specs = config.state.get("sources") or config.DEFAULT_SOURCES
+    if source_id not in specs:
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    uri = parse_uri(specs[source_id]["uri"])
+    if source_kind(uri) != "file" or not os.path.exists(uri):
+        return jsonify(error="Only existing video file sources have a frame index"), 400
+    index = FrameIndex.load(uri, config.FRAME_INDEX_DIR)
+    if index is None:
+        return jsonify(error="Index not built yet"), 404
+    return jsonify(index.summary())
+
+
+def number_arg(name):
+    """Query parameter as a finite float, None if absent; raises ValueError if malformed.
+
+    (request.args.get(name, type=float) would return None for a malformed value and
+    silently drop the filter.)
+    """
+    if name not in request.args:
+        return None
+    value = float(request.args[name])
+    if not math.isfinite(value):
+        raise ValueError(name)
+    return value
+
+
+@app.route('/heatmap/<source_id>')
+def source_heatmap(source_id):
+    """Return where people have been standing on a source.
+
+    Query parameters: format ("png" transparent overlay, "jpeg" blended onto the latest
+    frame, "npy" raw float32 grid of person-seconds) and window (seconds; omit for the
+    live heatmap, which fades with config.heatmap_half_life).
+    """
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    image_format = request.args.get('format', 'png').lower().replace('jpg', 'jpeg')
+    if image_format not in ('png', 'jpeg', 'npy'):
+        return jsonify(error="format must be png, jpeg or npy"), 400
+    try:
+        window = number_arg('window')
+    except ValueError:
+        return jsonify(error="window must be a number of seconds"), 400
+    max_window = config.heatmap_buckets * config.heatmap_bucket_seconds
+    if window is not None and not 0 < window <= max_window:
+        return jsonify(error=f"window must be between 0 and {max_window:g} seconds"), 400
+
+    if image_format == 'npy':
+        grid, meta = read_heatmap(config.state, source_id, window)
+        if grid is None:
+            return jsonify(error="No heatmap for this source yet"), 404
+        payload = io.BytesIO()
+        np.save(payload, grid)
+        payload.seek(0)
+        response = send_file(payload, mimetype='application/octet-stream',
+                             download_name=f"heatmap-{source_id}.npy")
+        response.headers['X-Heatmap-Cell-Size'] = str(meta["cell_size"])
+        return response
+
+    image = heatmap_cache.get(source_id, image_format, window)
+    if image is None:
+        return jsonify(error="No heatmap for this source yet"), 404
+    return Response(image, mimetype=f"image/{image_format}")
+
+
+def parse_count_lines(data):
+    """Validate a /sources/<id>/lines body; return (lines, error message)."""
+    lines = data.get('lines') if isinstance(data, dict) else data
+    if not isinstance(lines, list):
+        return None, "Provide a list of lines"
+    if len(lines) > config.max_count_lines:
+        return None, f"At most {config.max_count_lines} lines per source"
+    parsed = []
+    for line in lines:
+        if not isinstance(line, dict):
+            return None, "Each line must be an object with id, p1 and p2"
+        line_id = str(line.get('id', '')).strip()
+        if not line_id or not all(c.isalnum() or c in '-_' for c in line_id):
+            return None, "Line ids must be non-empty and use only letters, digits, '-' and '_'"
+        if any(other["id"] == line_id for other in parsed):
+            return None, f"Duplicate line id: {line_id}"
+        try:
+            p1 = [float(v) for v in line['p1']]
+            p2 = [float(v) for v in line['p2']]
+        except (KeyError, TypeError, ValueError):
+            return None, f"Line {line_id}: p1 and p2 must be [x, y] pairs of numbers"
+        if len(p1) != 2 or len(p2) != 2 or not all(0 <= v <= 1 for v in p1 + p2):
+            return None, f"Line {line_id}: p1 and p2 must be [x, y] with coordinates between 0 and 1"
+        if p1 == p2:
+            return None, f"Line {line_id}: p1 and p2 must differ"
+        parsed.append({"id": line_id, "name": str(line.get('name', line_id)), "p1": p1, "p2": p2})
+    return parsed, None
+
+
+@app.route('/sources/<source_id>/lines')
+def source_lines(source_id):
+    """Return a source's counting lines and each line's in/out totals since it was added or reset."""
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    snapshot = config.state.snapshot([f"count_lines:{source_id}", f"line_counts:{source_id}"])
+    counts = snapshot[f"line_counts:{source_id}"] or {}
+    return jsonify(lines=[
+        dict(line, counts=counts.get(line["id"], {"in": 0, "out": 0}))
+        for line in snapshot[f"count_lines:{source_id}"] or []
+    ])
+
+
+@app.route('/sources/<source_id>/lines', methods=['PUT'])
+def set_source_lines(source_id):
+    """Replace a source's counting lines.
+
+    JSON body: {"lines": [{"id": "door", "name": "Main door", "p1": [x, y], "p2": [x, y]}]}
+    with coordinates as fractions of the frame width and height. Looking from p1 towards
+    p2, people crossing from the left side to the right count as "in", the other way as
+    "out". Lines that keep their id keep their totals; the analysis applies the change
+    on its next frame.
+    """
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    lines, error = parse_count_lines(request.get_json(silent=True))
+    if error:
+        return jsonify(error=error), 400
+
+    lines_key, counts_key = f"count_lines:{source_id}", f"line_counts:{source_id}"
+    kept = {line["id"] for line in lines}
+    config.state.update_many([lines_key, counts_key], lambda values: {
+        lines_key: lines,
+        counts_key: {line_id: total for line_id, total in (values[counts_key] or {}).items() if line_id in kept},
+    })
+    return jsonify(status="Lines updated", id=source_id, lines=lines)
+
+
+@app.route('/sources/<source_id>/lines/reset', methods=['POST'])
+def reset_source_lines(source_id):
+    """Zero the in/out totals of every counting line of a source."""
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    counts_key, events_key = f"line_counts:{source_id}", f"events:{source_id}"
+
+    def reset(values):
+        reset_values = {counts_key: {}}
+        if values[events_key] is not None:  # Tell push clients right away, not on the next change
+            reset_values[events_key] = dict(values[events_key], lines={}, crossings={}, t=time.time())
+        return reset_values
+
+    config.state.update_many([counts_key, events_key], reset)
+    return jsonify(status="Line counts reset", id=source_id)
+
+
+@app.route('/events/<source_id>')
+def source_events(source_id):
+    """Push a source's live count, weapon flag and line totals as Server-Sent Events.
+
+    An event is sent on connect and then whenever one of them changes; events with
+    line crossings carry them as {"crossings": {line_id: [in, out]}}.
+    """
+    if source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+    events = get_publisher(config.state, f"events:{source_id}").frames()
+    return Response(event_stream(events), mimetype=SSE_MIMETYPE,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/face_video')
 def face_video():
-    if config.face_detection_enabled:
-        # Use advanced method if configured, otherwise use basic
-        if config.face_recognition_method == 'advanced':
-            return Response(generate_face_frame_advanced(), mimetype='multipart/x-mixed-replace; boundary=frame')
-        else:
-            return Response(generate_face_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    if config.state.get("face_detection_enabled", config.STATE_DEFAULTS["face_detection_enabled"]):
+        # The analysis process applies the configured basic/advanced method before publishing
+        return Response(generate_face_frame(), mimetype=MJPEG_MIMETYPE)
     else:
         return jsonify(error="Face detection is not enabled"), 400
 
 
 @app.route('/toggle_face_detection')
 def toggle_face_detection():
-    config.face_detection_enabled = not config.face_detection_enabled  # Toggle state
-    
+    enabled = not config.state.get("face_detection_enabled", config.STATE_DEFAULTS["face_detection_enabled"])
+
     # Reload known faces when starting detection to ensure latest faces are loaded
-    if config.face_detection_enabled:
-        load_known_faces_from_folder()
-    
+    if enabled:
+        known_faces_count = load_known_faces_from_folder()
+    else:
+        known_faces_count = len(read_known_faces()[1])
+    config.state.set("face_detection_enabled", enabled)  # Toggle state
+
     return jsonify(
-        status="Face detection started" if config.face_detection_enabled else "Face detection stopped",
-        known_faces_count=len(config.known_faces_encoding)
+        status="Face detection started" if enabled else "Face detection stopped",
+        known_faces_count=known_faces_count
     )
 
 
 @app.route('/upload_face', methods=['POST'])
 def upload_face():
-    """Accept an uploaded face image, save it to known_faces folder, and reload all known faces."""
+    """Accept an uploaded face image, save it to known_faces folder, and add it to the known faces."""
     if 'image' not in request.files:
         return jsonify(error="No image file provided"), 400
 
@@ -114,18 +397,14 @@ def upload_face():
 
     try:
         # Define the known_faces directory path
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        known_faces_dir = os.path.join(base_dir, "modules", "Facial recognition", "known_faces")
+        known_faces_dir = config.KNOWN_FACES_DIR
         
         # Create directory if it doesn't exist
         os.makedirs(known_faces_dir, exist_ok=True)
         
         # Generate a safe filename (remove special characters, keep extension)
         original_filename = file.filename
-        name_without_ext = os.path.splitext(original_filename)[0]
-        # Clean filename: remove special characters, keep only alphanumeric and spaces
-        safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in name_without_ext)
-        safe_name = safe_name.strip() or "uploaded_person"
+        safe_name = safe_face_name(original_filename)
         
         # Get file extension
         file_ext = os.path.splitext(original_filename)[1] or '.jpg'
@@ -147,44 +426,114 @@ def upload_face():
         file.seek(0)  # Reset file pointer
         file.save(file_path)
         
-        # Verify face can be detected in saved image
-        upload_image = face_recognition.load_image_file(file_path)
-        encodings = face_recognition.face_encodings(upload_image, num_jitters=0)
-        if len(encodings) == 0:
+        # Verify face can be detected in saved image. dlib runs in the face pool, not
+        # here: under serve.py it would freeze the event loop and every stream with it
+        result = get_pool().submit(encode_face_image, (saved_filename, file_path)).result()
+        if result["encoding"] is None:
             # Remove the file if no face detected
             os.remove(file_path)
+            if result["status"] == "unreadable":
+                return jsonify(error="Could not read the uploaded image"), 400
             return jsonify(error="No face detected in the uploaded image"), 400
 
-        # Reload all known faces from the folder
-        load_known_faces_from_folder()
+        # Add the new face to the gallery (the analysis process picks up the new gallery)
+        gallery_name = os.path.splitext(saved_filename)[0]
+        total_faces = add_known_faces([result["encoding"]], [gallery_name])
+        remember_encodings({saved_filename: result["encoding"]})
         
         # Reset match state
-        config.latest_match_image = None
-        config.latest_match_name = safe_name
-        config.match_detected = False
+        config.state.set_many({
+            "latest_match_sighting": None,
+            "latest_match_name": safe_name,
+            "match_detected": False,
+        })
 
         return jsonify(
             status="Face uploaded and saved", 
             name=safe_name,
             filename=saved_filename,
-            total_faces=len(config.known_faces_encoding)
+            total_faces=total_faces
         )
     except Exception as exc:
         return jsonify(error=f"Failed to process image: {exc}"), 500
 
 
+@app.route('/enrol_faces', methods=['POST'])
+def enrol_faces():
+    """Bulk-enrol a watchlist from a zip archive ('archive') and/or many images ('images').
+
+    Images are named after their file names. Decoding and encoding run in a process pool;
+    poll /enrol_faces/<job_id> for progress and the per-file accept/reject report.
+    """
+    files, skipped = [], []
+    try:
+        for archive in request.files.getlist('archive'):
+            archive_files, archive_skipped = read_archive(archive.read())
+            files.extend(archive_files)
+            skipped.extend(archive_skipped)
+    except zipfile.BadZipFile:
+        return jsonify(error="Archive is not a valid zip file"), 400
+
+    for image in request.files.getlist('images'):
+        if not image.filename:
+            continue
+        if not image.filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            skipped.append({"file": image.filename, "status": "rejected", "reason": "not_an_image"})
+            continue
+        data = image.read()
+        if len(data) > config.enrol_max_file_bytes:
+            skipped.append({"file": image.filename, "status": "rejected", "reason": "too_large"})
+            continue
+        files.append((image.filename, data))
+
+    if not files and not skipped:
+        return jsonify(error="No images provided"), 400
+    if len(files) > config.enrol_max_files:
+        return jsonify(error=f"At most {config.enrol_max_files} images per batch"), 400
+
+    job_id = start_enrolment(files, skipped)
+    return jsonify(status="Enrolment started", job_id=job_id, total=len(files) + len(skipped)), 202
+
+
+@app.route('/enrol_faces/<job_id>')
+def enrol_faces_status(job_id):
+    """Return progress of an enrolment job; the report lists every file as accepted or rejected."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify(error="Unknown enrolment job"), 404
+    return jsonify(job)
+
+
 @app.route('/face_match_status')
 def face_match_status():
     """Return whether a match has been detected and if a screenshot is ready."""
+    match = config.state.snapshot(
+        ["match_detected", "latest_match_sighting", "latest_match_name",
+         "latest_match_confidence", "face_recognition_method"],
+        defaults=config.STATE_DEFAULTS,
+    )
+    sighting_id = match["latest_match_sighting"]
     return jsonify(
-        match_found=config.match_detected,
-        screenshot_available=config.latest_match_image is not None,
-        name=config.latest_match_name,
-        confidence=getattr(config, 'latest_match_confidence', None),
-        method=config.face_recognition_method,
+        match_found=match["match_detected"],
+        screenshot_available=sighting_id is not None and config.get_sighting_log().get_thumbnail(sighting_id) is not None,
+        name=match["latest_match_name"],
+        confidence=match["latest_match_confidence"],
+        method=match["face_recognition_method"],
+        sighting_id=sighting_id,
     )
 
 
+@app.route('/face_quality_stats')
+def face_quality_stats():
+    """Report how many detected faces the quality gate let through, skipped (and why) or
+    encoded late from their best crop, with the size/sharpness/brightness/yaw distributions."""
+    source_id = request.args.get('source_id', config.FACE_SOURCE_ID)
+    stats = config.state.get(f"face_quality:{source_id}")
+    if stats is None:
+        return jsonify(error="No face quality statistics for this source yet"), 404
+    return jsonify(stats)
+
+
 @app.route('/set_face_recognition_method', methods=['POST'])
 def set_face_recognition_method():
     """Switch between 'basic' and 'advanced' face recognition methods."""
@@ -194,21 +543,168 @@ def set_face_recognition_method():
     if method not in ['basic', 'advanced']:
         return jsonify(error="Method must be 'basic' or 'advanced'"), 400
     
-    config.face_recognition_method = method
+    config.state.set("face_recognition_method", method)
     return jsonify(status=f"Face recognition method set to {method}", method=method)
 
 
 @app.route('/face_screenshot')
 def face_screenshot():
-    """Return the captured screenshot of the matched face."""
-    if config.latest_match_image is None:
+    """Return the face thumbnail of the most recent match."""
+    match = config.state.snapshot(["latest_match_sighting", "latest_match_name"], defaults=config.STATE_DEFAULTS)
+    thumbnail = None
+    if match["latest_match_sighting"] is not None:
+        thumbnail = config.get_sighting_log().get_thumbnail(match["latest_match_sighting"])
+    if thumbnail is None:
         return jsonify(error="No screenshot available"), 404
     return send_file(
-        io.BytesIO(config.latest_match_image),
+        io.BytesIO(thumbnail),
         mimetype='image/jpeg',
         as_attachment=True,
-        download_name=f"{config.latest_match_name or 'match'}_screenshot.jpg",
+        download_name=f"{match['latest_match_name'] or 'match'}_screenshot.jpg",
+    )
+
+
+@app.route('/sightings')
+def sightings():
+    """Return a page of logged sightings, newest first.
+
+    Query parameters: name, since and until (unix timestamps), page, per_page.
+    """
+    try:
+        since = number_arg('since')
+        until = number_arg('until')
+    except ValueError:
+        return jsonify(error="since and until must be unix timestamps"), 400
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 500)
+    except ValueError:
+        return jsonify(error="page and per_page must be integers"), 400
+
+    result = config.get_sighting_log().query(
+        name=request.args.get('name') or None,
+        since=since,
+        until=until,
+        page=page,
+        per_page=per_page,
     )
+    return jsonify(result)
+
+
+@app.route('/sightings/<sighting_id>/thumbnail')
+def sighting_thumbnail(sighting_id):
+    """Return the cropped face thumbnail of one sighting."""
+    thumbnail = config.get_sighting_log().get_thumbnail(sighting_id)
+    if thumbnail is None:
+        return jsonify(error="Thumbnail not found"), 404
+    return send_file(io.BytesIO(thumbnail), mimetype='image/jpeg')
+
+
+def admin_denied():
+    """Error response if the request lacks the admin token (only checked when one is configured)."""
+    if config.admin_token and request.headers.get('X-Admin-Token') != config.admin_token:
+        return jsonify(error="Admin token required"), 403
+    return None
+
+
+@app.route('/admin/profile', methods=['POST'])
+def request_profile():
+    """Profile the running pipelines for a few seconds without restarting anything.
+
+    JSON body: seconds (default 10), mode ("trace", "sample" or "both"), source_id
+    (trace only this source) and sample_interval (seconds between stack samples).
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}  # Every field has a default
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object"), 400
+    try:
+        seconds = float(data.get('seconds', 10))
+        sample_interval = float(data.get('sample_interval', 0.005))
+    except (TypeError, ValueError):
+        return jsonify(error="seconds and sample_interval must be numbers"), 400
+    if not 0 < seconds <= config.profile_max_seconds:
+        return jsonify(error=f"seconds must be between 0 and {config.profile_max_seconds}"), 400
+    if not 0.001 <= sample_interval <= 1:
+        return jsonify(error="sample_interval must be between 0.001 and 1"), 400
+    mode = data.get('mode', 'both')
+    if mode not in PROFILE_MODES:
+        return jsonify(error=f"mode must be one of {', '.join(PROFILE_MODES)}"), 400
+    source_id = data.get('source_id')
+    if source_id is not None and not isinstance(source_id, str):
+        return jsonify(error="source_id must be a string"), 400
+    if source_id is not None and source_id not in (config.state.get("sources") or config.DEFAULT_SOURCES):
+        return jsonify(error=f"Unknown source: {source_id}"), 404
+
+    profile_id = uuid.uuid4().hex[:12]
+    profile_request = {
+        "id": profile_id,
+        "seconds": seconds,
+        "mode": mode,
+        "source_id": source_id,
+        "sample_interval": sample_interval,
+    }
+
+    # One profile at a time: queue this one only if the previous one has finished (or is
+    # long overdue, e.g. the analysis process restarted while it was queued)
+    previous = config.state.get("profile_request")
+    previous_key = f"profile:{previous['id']}" if previous else "profile:none"
+
+    def queue(values):
+        job = values[previous_key] or {}
+        if (values["profile_request"] or {}).get("id") != (previous or {}).get("id"):
+            return {}  # Someone else queued a profile just now
+        if job.get("status") in ("queued", "running") and time.time() < job["requested"] + job["seconds"] + 60:
+            return {}
+        return {
+            "profile_request": profile_request,
+            f"profile:{profile_id}": dict(profile_request, status="queued", requested=time.time()),
+        }
+
+    if not config.state.update_many(["profile_request", previous_key], queue):
+        return jsonify(error="Another profile is already running"), 409
+    return jsonify(status="Profile queued", profile_id=profile_id), 202
+
+
+@app.route('/admin/profile/<profile_id>')
+def profile_status(profile_id):
+    """Return the status of a profile and, once done, its summary: fps and per-stage
+    mean/p50/p95/max ms of each pipeline (crowd, face) on each source."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    job = config.state.get(f"profile:{profile_id}")
+    if job is None:
+        return jsonify(error="Unknown profile"), 404
+    return jsonify(job)
+
+
+@app.route('/admin/profile/<profile_id>/<kind>')
+def profile_file(profile_id, kind):
+    """Download a finished profile: 'collapsed' stacks (flamegraph.pl / speedscope) or the stage 'timeline'."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    files = {
+        'collapsed': (".collapsed", 'text/plain'),
+        'timeline': (".timeline.json", 'application/json'),
+    }
+    if kind not in files or config.state.get(f"profile:{profile_id}") is None:
+        return jsonify(error="Unknown profile file"), 404
+    suffix, mimetype = files[kind]
+    path = os.path.join(config.PROFILES_DIR, profile_id + suffix)
+    if not os.path.exists(path):
+        return jsonify(error=f"No {kind} output for this profile (check its mode and status)"), 404
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=f"profile-{profile_id}{suffix}")
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development setup: one API process plus the analysis process it spawns.
+    # For several API workers run `python analysis.py` separately and serve the API with
+    # CROWD_EXTERNAL_ANALYSIS=1 gunicorn -w 4 -b 0.0.0.0:5000 --threads 8 app:app
+    if not config.external_analysis:
+        start_analysis_process()
+    app.run(threaded=True)
@@ -0,0 +1,135 @@
+import sys
+import os
+import gc
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "modules"))  # Add 'modules' dir to path
+
+import cv2
+import numpy as np
+from frame_pool import FramePool
+from state import StateStore
+from streaming import multipart_stream
+
+# Frame memory allocations per frame along the pipeline's non-model path (decode,
+# resize + overlay, BGR->RGB for the face modules, JPEG publish, multipart chunk),
+# before and after the buffer pool. The model is left out: it allocates the same
+# either way.
+#
+#   python benchmark_frames.py [video] [--frames N]
+
+BIG = 16 * 1024  # Allocations at least this large count as frame buffers (JPEGs included)
+AREA = np.array([(0, 0), (640, 0), (640, 320), (0, 320)], np.int32)
+
+
+class AllocationMeter:
+    """Count frame-sized allocations per pipeline step using tracemalloc peaks."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled  # Disabled for the timing run (tracemalloc slows everything down)
+        self.buffers = 0
+        self.bytes = 0
+
+    def step(self, function, *args):
+        if not self.enabled:
+            return function(*args)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args)
+        grown = tracemalloc.get_traced_memory()[1] - before
+        if grown >= BIG:
+            self.buffers += 1
+            self.bytes += grown
+        return result
+
+
+def baseline_frame(capture, store, meter):
+    """The per-frame path before pooling."""
+    success, frame = meter.step(capture.retrieve)
+    resized = meter.step(cv2.resize, frame, (640, 320))
+    cv2.polylines(resized, [AREA], True, (0, 255, 0), 3)
+    meter.step(cv2.cvtColor, frame, cv2.COLOR_BGR2RGB)
+    overlay = meter.step(frame.copy)
+    _, jpeg = cv2.imencode('.jpg', resized)
+    meter.step(lambda: store.set("frame", jpeg.tobytes()))
+    data = store.get("frame")
+    meter.step(lambda: b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+    return overlay
+
+
+def pooled_frame(capture, store, meter, pools, shape):
+    """The same path with pooled buffers, dst= outputs and copy-free publishing."""
+    source_pool, resize_pool, rgb_pool, overlay_pool = pools
+    success, frame = meter.step(capture.retrieve, source_pool.acquire(shape))
+    resized = meter.step(lambda: cv2.resize(frame, (640, 320), dst=resize_pool.acquire((320, 640, 3))))
+    cv2.polylines(resized, [AREA], True, (0, 255, 0), 3)
+    rgb = meter.step(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_pool.acquire_like(frame)))
+    overlay = meter.step(overlay_pool.copy, frame)
+    _, jpeg = cv2.imencode('.jpg', resized)
+    meter.step(lambda: store.set("frame", jpeg.data))
+    data = store.get("frame")
+    meter.step(lambda: list(multipart_stream([data])))
+    for pool, buffer in zip(pools, (frame, resized, rgb, overlay)):
+        pool.release(buffer)
+
+
+def run(path, frames, pooled, measure):
+    capture = cv2.VideoCapture(path)
+    store = StateStore(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    pools = [FramePool(), FramePool(), FramePool(), FramePool()]
+    _, first = capture.read()
+    shape = first.shape
+    meter = AllocationMeter(enabled=measure)
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+
+    if measure:
+        tracemalloc.start()
+    start = time.perf_counter()
+    done = 0
+    while done < frames:
+        if not capture.grab():
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Short test video: loop it
+            continue
+        if pooled:
+            pooled_frame(capture, store, meter, pools, shape)
+        else:
+            baseline_frame(capture, store, meter)
+        done += 1
+    elapsed = time.perf_counter() - start
+    if measure:
+        tracemalloc.stop()
+    capture.release()
+
+    return {
+        "frame_buffers_per_frame": meter.buffers / done,
+        "kib_allocated_per_frame": meter.bytes / done / 1024,
+        "ms_per_frame": elapsed / done * 1000,
+        "gc_collections": sum(stat["collections"] for stat in gc.get_stats()) - collections,
+        "pool": {name: pool.stats() for name, pool in zip(("source", "resize", "rgb", "overlay"), pools)}
+        if pooled else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame buffer allocations per frame, before and after pooling")
+    parser.add_argument("video", nargs="?", default=os.path.join(os.path.dirname(__file__), "test_videos", "video_3.mp4"))
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    for name, pooled in (("before (allocating)", False), ("after (pooled)", True)):
+        result = run(args.video, args.frames, pooled, measure=True)
+        timing = run(args.video, args.frames, pooled, measure=False)
+        print(f"{name}:")
+        print(f"  frame buffers allocated per frame: {result['frame_buffers_per_frame']:.2f}")
+        print(f"  KiB allocated per frame:           {result['kib_allocated_per_frame']:.1f}")
+        print(f"  ms per frame:                      {timing['ms_per_frame']:.2f}")
+        print(f"  gc collections:                    {timing['gc_collections']}")
+        if result["pool"]:
+            print(f"  pools: {result['pool']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import threading
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "modules"))  # Add 'modules' dir to path
+
+import numpy as np
+
+# Load test for the stream endpoints: opens hundreds of concurrent MJPEG viewers
+# against a running server and polls the JSON routes at the same time, then reports
+# per-viewer frame rates and JSON latencies.
+#
+#   python serve.py --quiet &
+#   python loadtest_streams.py --viewers 500 --duration 30
+#
+# --publish writes synthetic frames into the state store at --fps, so the serving
+# side can be measured without a camera or the model (the analysis process should
+# not be publishing the same source meanwhile; run serve.py with
+# CROWD_EXTERNAL_ANALYSIS=1 and no analysis.py).
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+async def viewer(host, port, path, duration, results):
+    stats = {"frames": 0, "first_frame": None, "error": None}
+    results.append(stats)
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise IOError(status.decode(errors="replace").strip())
+        tail = b""
+        while time.perf_counter() - start < duration:
+            chunk = await asyncio.wait_for(reader.read(65536), timeout=10)
+            if not chunk:
+                raise IOError("connection closed")
+            data = tail + chunk
+            found = data.count(b"--frame\r\n")
+            if found and stats["first_frame"] is None:
+                stats["first_frame"] = time.perf_counter() - start
+            stats["frames"] += found
+            tail = data[-10:]  # A boundary split across two reads
+        writer.close()
+    except Exception as e:
+        stats["error"] = str(e) or type(e).__name__
+    stats["elapsed"] = time.perf_counter() - start
+
+
+async def json_poller(host, port, paths, rate, duration, latencies, errors):
+    end = time.perf_counter() + duration
+    index = 0
+    while time.perf_counter() < end:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=10)
+            writer.close()
+            if b" 200 " not in response.split(b"\r\n", 1)[0]:
+                raise IOError(response.split(b"\r\n", 1)[0].decode(errors="replace"))
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            errors.append(str(e) or type(e).__name__)
+        await asyncio.sleep(max(0.0, 1.0 / rate - (time.perf_counter() - start)))
+
+
+def publish_frames(key, fps, stop):
+    """Write a synthetic 640x320 JPEG (with a moving bar) to the store at ``fps``."""
+    import cv2
+    import config
+
+    frame = np.zeros((320, 640, 3), dtype=np.uint8)
+    published = 0
+    while not stop.is_set():
+        frame[:] = 40
+        x = (published * 8) % 640
+        frame[:, x:x + 20] = (0, 200, 255)
+        ret, buffer = cv2.imencode('.jpg', frame)
+        config.state.set(key, buffer.data)
+        published += 1
+        stop.wait(1.0 / fps)
+
+
+async def main(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+
+    stop = threading.Event()
+    if args.publish:
+        key = f"frame:crowd:{args.path.rsplit('/', 1)[-1]}" if args.path.startswith("/video/") else "frame:crowd:default"
+        threading.Thread(target=publish_frames, args=(key, args.fps, stop), daemon=True).start()
+
+    results, latencies, json_errors = [], [], []
+    tasks = []
+    for _ in range(args.viewers):
+        tasks.append(asyncio.create_task(viewer(host, port, args.path, args.duration, results)))
+        await asyncio.sleep(args.ramp / args.viewers)  # Spread the connects over --ramp seconds
+    tasks.append(asyncio.create_task(json_poller(
+        host, port, args.json_paths.split(","), args.json_rate, args.duration, latencies, json_errors
+    )))
+    await asyncio.gather(*tasks)
+    stop.set()
+
+    ok = [r for r in results if r["error"] is None]
+    fps = [r["frames"] / r["elapsed"] for r in ok]
+    first = [r["first_frame"] * 1000 for r in ok if r["first_frame"] is not None]
+    failures = {}
+    for r in results:
+        if r["error"] is not None:
+            failures[r["error"]] = failures.get(r["error"], 0) + 1
+
+    print(f"viewers:          {len(ok)}/{len(results)} streamed for {args.duration:g}s")
+    if failures:
+        print(f"viewer failures:  {failures}")
+    print(f"fps per viewer:   min {min(fps, default=0):.1f}  p50 {percentile(fps, 50):.1f}  "
+          f"mean {np.mean(fps) if fps else 0:.1f}")
+    print(f"first frame (ms): p50 {percentile(first, 50):.0f}  p95 {percentile(first, 95):.0f}")
+    print(f"json requests:    {len(latencies)} ok, {len(json_errors)} failed")
+    print(f"json latency (ms): p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+          f"max {max(latencies, default=float('nan')):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent MJPEG viewer load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--path", default="/video", help="Stream endpoint, e.g. /video or /video/<source_id>")
+    parser.add_argument("--viewers", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds each viewer stays connected")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which viewers connect")
+    parser.add_argument("--json-paths", default="/crowd_count,/weapon_status,/face_match_status")
+    parser.add_argument("--json-rate", type=float, default=20.0, help="JSON requests per second")
+    parser.add_argument("--publish", action="store_true", help="Publish synthetic frames into the store")
+    parser.add_argument("--fps", type=float, default=15.0, help="Frame rate of --publish")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,166 @@
+import time
+import threading
+import multiprocessing
+import cv2
+import config
+import crowd_detection
+import face_recog
+import face_recog_advanced
+import profiling
+from frame_pool import FramePool
+from face_quality import FaceQualityGate
+from known_faces import load_known_faces_from_folder, read_known_faces
+from sources import SourceManager
+
+
+def run_face_analysis(frames, source_id=config.FACE_SOURCE_ID):
+    """Run face matching on one source's frames while face detection is enabled."""
+    frame_skip = 2  # Process every 2nd frame to reduce load
+    frame_counter = 0
+    known_version = object()
+    known_faces_encoding, known_faces_name = [], []
+    pool = FramePool(max_buffers=4)
+    overlay = None  # Our pooled copy of the frame being processed
+    quality_gate = FaceQualityGate(
+        min_size=config.face_min_size,
+        min_sharpness=config.face_min_sharpness,
+        brightness_range=config.face_brightness_range,
+        max_yaw=config.face_max_yaw,
+        defer_seconds=config.face_defer_seconds,
+        defer_min_size=config.face_defer_min_size,
+    ) if config.face_quality_enabled else None
+    stats_published = 0.0
+
+    for frame in frames:
+        settings = config.state.snapshot(
+            ["face_detection_enabled", "face_recognition_method", "known_faces_version"],
+            defaults=config.STATE_DEFAULTS,
+        )
+        if not settings["face_detection_enabled"]:
+            continue
+
+        frame_counter += 1
+        if frame_counter % frame_skip != 0:
+            continue  # Skip this frame
+
+        with profiling.frame("face", source_id):
+            pool.release(overlay)  # The previous copy was encoded and published already
+            frame = overlay = pool.copy(frame)  # The crowd pipeline shares the source's frame; draw on our own
+
+            # Pick up a new gallery (and start fresh sighting windows) whenever it is swapped
+            if settings["known_faces_version"] != known_version:
+                known_faces_encoding, known_faces_name, known_version = read_known_faces()
+                config.get_sighting_log().reset_dedup()
+
+            if settings["face_recognition_method"] == 'advanced':
+                frame = face_recog_advanced.process_face_frame(
+                    frame, known_faces_encoding, known_faces_name, source_id, quality_gate=quality_gate
+                )
+            else:
+                frame = face_recog.process_face_frame(frame, known_faces_encoding, known_faces_name, source_id)
+
+            with profiling.stage("imencode"):
+                ret, buffer = cv2.imencode('.jpg', frame)
+            if ret:
+                with profiling.stage("publish"):
+                    config.state.set("frame:face", buffer.data)
+
+        if quality_gate is not None and time.time() - stats_published > 2.0:
+            config.state.set(f"face_quality:{source_id}", quality_gate.stats())
+            stats_published = time.time()
+
+
+def attach_pipelines(source):
+    """Start the analysis threads for a newly added source; they end when it is removed."""
+    # The crowd pipeline resizes into a new buffer before drawing, so it can share the frame
+    threading.Thread(
+        target=crowd_detection.run_crowd_analysis,
+        args=(source.frames(copy=False, numbered=True), source.source_id, source.kind == "file"),
+        name=f"crowd-{source.source_id}",
+        daemon=True,
+    ).start()
+    if source.source_id == config.FACE_SOURCE_ID:
+        threading.Thread(
+            target=run_face_analysis,
+            args=(source.frames(copy=False), source.source_id),
+            name="face-analysis",
+            daemon=True,
+        ).start()
+
+
+def start_profile(request):
+    """Run a profiling session requested through /admin/profile and report back in the store."""
+    key = f"profile:{request['id']}"
+
+    def on_done(summary, error):
+        config.state.update(key, lambda job: dict(
+            job or {}, status="failed" if error else "done", error=error, summary=summary, finished=time.time()
+        ))
+
+    started = profiling.start(
+        request["id"],
+        config.PROFILES_DIR,
+        seconds=request["seconds"],
+        mode=request["mode"],
+        source_id=request.get("source_id"),
+        sample_interval=request.get("sample_interval", 0.005),
+        on_done=on_done,
+    )
+    if started:
+        config.state.update(key, lambda job: dict(job or {}, status="running", started=time.time()))
+    else:
+        config.state.update(key, lambda job: dict(job or {}, status="failed", error="Another profile is running"))
+
+
+def reset_live_state():
+    """Clear the values published by a previous run; configuration and jobs are kept."""
+    config.state.set_many({
+        key: config.STATE_DEFAULTS.get(key.split(":", 1)[0])
+        for key in config.state.keys()
+        if key.split(":", 1)[0] in config.LIVE_STATE_KEYS
+    })
+
+
+def run_analysis(poll_interval=0.25):
+    """Entry point of the analysis process: owns the sources and the models.
+
+    Applies source changes made through the API and reports per-source health.
+    """
+    reset_live_state()
+    load_known_faces_from_folder()  # Picks up images added while stopped; unchanged ones come from the cache
+    if config.state.get("sources") is None:
+        config.state.set("sources", config.DEFAULT_SOURCES)
+
+    manager = SourceManager(config.FRAME_INDEX_DIR, on_start=attach_pipelines)
+    print("[INFO] Analysis process started")
+    sources_version = 0
+    # Seeks requested before this process started belong to a previous run
+    previous_seeks, seek_version = config.state.get_if_newer("source_seek", 0)
+    applied_seeks = {source_id: seek.get("request") for source_id, seek in (previous_seeks or {}).items()}
+    _, profile_version = config.state.get_if_newer("profile_request", 0)
+    while True:
+        specs, sources_version = config.state.get_if_newer("sources", sources_version)
+        if specs is not None:
+            manager.sync(specs)
+        seeks, seek_version = config.state.get_if_newer("source_seek", seek_version)
+        for source_id, seek in (seeks or {}).items():
+            if seek.get("request") != applied_seeks.get(source_id):
+                applied_seeks[source_id] = seek.get("request")
+                manager.seek(source_id, seconds=seek.get("seconds"), frame=seek.get("frame"))
+        profile_request, profile_version = config.state.get_if_newer("profile_request", profile_version)
+        if profile_request is not None:
+            start_profile(profile_request)
+        config.state.set("source_health", manager.health())
+        time.sleep(poll_interval)
+
+
+def start_analysis_process():
+    """Start the analysis in a dedicated child process (single-node development setup).
+
+    Uses the spawn start method so the child builds its own threads, sources and model
+    instead of inheriting half-initialised ones through fork.
+    """
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=run_analysis, name="crowd-analysis", daemon=True)
+    process.start()
+    return process
@@ -1,44 +1,128 @@
-import torch
-import cv2
-import numpy as np
 import os
-import face_recognition
-from tracker import Tracker
+import threading
+from sightings import SightingLog
+from state import StateStore
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# YOLOv5 model, loaded on first use so API worker processes never import torch.
+# Shared by every source's crowd pipeline; inference is serialized with model_lock.
+model = None
+model_lock = threading.Lock()
+
+
+def load_model():
+    global model
+    if model is None:
+        import torch
+        model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
+    return model
 
-# Load YOLOv5 model
-model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
 
 # Paths
 TEST_VIDEO_PATH = "test_videos/video_3.mp4"  # Sample video file (used only if you switch to file input)
+KNOWN_FACES_DIR = os.path.join(BASE_DIR, "modules", "Facial recognition", "known_faces")
 
-# Initialize Camera (use default webcam on Windows; 0 is the usual built‑in / primary camera)
+# Camera source (use default webcam on Windows; 0 is the usual built‑in / primary camera)
 # If you have multiple cameras, you can try 1, 2, ... here instead of 0.
-camera = cv2.VideoCapture(0)
+# This seeds the "default" source; more webcams, files and RTSP URLs are added at
+# runtime through /sources and decoded by the analysis process (see modules/sources.py).
+CAMERA_SOURCE = 0
+DEFAULT_SOURCE_ID = "default"
+DEFAULT_SOURCES = {DEFAULT_SOURCE_ID: {"uri": CAMERA_SOURCE, "decode_mode": "full"}}
+FACE_SOURCE_ID = DEFAULT_SOURCE_ID  # Source the face pipeline runs on
+
+# Keyframe/timestamp indexes of recorded videos, built on first open (see modules/frame_index.py)
+FRAME_INDEX_DIR = os.path.join(BASE_DIR, "frame_index")
 
-tracker = Tracker()
 area = [(0, 0), (0, 499), (1019, 499), (1019, 0)]
-crowd_count = 0
-weapon_detected = False
-
-# Face recognition setup (populated after user upload)
-known_faces_encoding = []
-known_faces_name = []
-
-# Example: Load known person image
-# known_person1_image = face_recognition.load_image_file(person1_IMAGE_PATH)
-# known_person1_encoding = face_recognition.face_encodings(known_person1_image)[0]
-# known_faces_encoding.append(known_person1_encoding)
-# known_faces_name.append("person1")
-
-face_detection_enabled = False
-
-# Latest match state
-latest_match_image = None  # JPEG bytes of the first match frame
-latest_match_name = None
-latest_match_confidence = 0.0
-match_detected = False
-
-# Face recognition method: 'basic' or 'advanced'
-# 'basic' uses compare_faces with tolerance
-# 'advanced' uses face_distance with HOG model (better for Windows)
-face_recognition_method = 'advanced'  # Change to 'basic' to use the original method
+
+# Runtime state shared by the analysis process and every API worker process.
+# Crowd count, weapon flag, face toggle, known faces and match state live here
+# instead of in module globals; see modules/state.py.
+STATE_DB_PATH = os.environ.get("CROWD_STATE_DB", os.path.join(BASE_DIR, "state.db"))
+# Configuration and jobs are synced to disk on every write; everything else is live
+# state that the analysis process republishes continuously.
+PERSISTENT_STATE_KEYS = ("sources", "count_lines", "line_counts", "enrol_job", "profile")
+state = StateStore(STATE_DB_PATH, persistent=PERSISTENT_STATE_KEYS)
+
+# Values returned for keys nobody has written yet. Per-source keys are suffixed
+# with ":<source_id>" (crowd_count:default, weapon_detected:default, frame:crowd:default).
+STATE_DEFAULTS = {
+    "crowd_count": 0,
+    "weapon_detected": False,
+    "sources": None,  # Desired source specs, written by the API and applied by the analysis process
+    "source_health": {},
+    "source_seek": {},  # source_id -> {"seconds"|"frame": ..., "request": id}, applied by the analysis process
+    "face_detection_enabled": False,
+    "face_recognition_method": 'advanced',  # 'basic' uses compare_faces, 'advanced' uses face_distance with HOG
+    "known_faces_version": None,
+    "known_faces_name": [],
+    "match_detected": False,
+    "latest_match_sighting": None,  # Sighting id of the most recent match (thumbnail served by /face_screenshot)
+    "latest_match_name": None,
+    "latest_match_confidence": 0.0,
+}
+
+# What the analysis publishes while running (names, or ``name:<suffix>`` families). The
+# analysis process resets these when it starts, to their STATE_DEFAULTS value or None,
+# so API workers never serve the previous run's counts, flags or frames as current.
+LIVE_STATE_KEYS = (
+    "crowd_count", "weapon_detected", "frame", "frame_number", "events", "heatmap", "source_health",
+    "face_quality", "match_detected", "latest_match_sighting", "latest_match_name", "latest_match_confidence",
+)
+
+# Set CROWD_EXTERNAL_ANALYSIS=1 when the analysis process is started separately
+# (python analysis.py) and the API runs under a multi-worker server.
+external_analysis = os.environ.get("CROWD_EXTERNAL_ANALYSIS") == "1"
+
+# Face quality gate between detection and encoding (advanced method, see modules/face_quality.py)
+face_quality_enabled = True
+face_min_size = 40  # Pixels, shorter side of the face box
+face_min_sharpness = 40.0  # Variance of the Laplacian of the face resized to 64x64
+face_brightness_range = (40, 220)  # Mean grey level
+face_max_yaw = 0.35  # Landmark asymmetry: 0 frontal, 1 side-on
+face_defer_seconds = 1.0  # A face unseen this long has left; its best crop is encoded if never matched
+face_defer_min_size = 24  # Smallest face worth a late encoding of its best crop
+
+# Crowd density heatmap per source (see modules/heatmap.py)
+heatmap_cell_size = 8  # Pixels of the 640x320 analysis frame per heatmap cell
+heatmap_half_life = 60.0  # Seconds for the live heatmap to fade to half
+heatmap_bucket_seconds = 60.0  # Granularity of time-windowed heatmaps
+heatmap_buckets = 60  # Buckets retained: windows up to an hour
+heatmap_publish_change = 0.05  # Republish once new detections add 5% to the live heatmap
+
+# Directed entry/exit counting lines per source (see modules/line_counter.py)
+max_count_lines = 64
+
+# On-demand profiling of the live pipelines (/admin/profile)
+PROFILES_DIR = os.path.join(BASE_DIR, "profiles")
+profile_max_seconds = 300
+# When set, /admin routes and source changes (add, remove, seek) require this value in the X-Admin-Token header
+admin_token = os.environ.get("CROWD_ADMIN_TOKEN")
+
+# Bulk gallery enrolment (/enrol_faces)
+enrol_workers = max(1, (os.cpu_count() or 2) - 1)  # Processes decoding and encoding faces
+enrol_max_files = 5000  # Images per batch
+enrol_max_file_bytes = 10 * 1024 * 1024  # Per image, also applied to zip members
+enrol_duplicate_distance = 0.35  # Closer than this to an enrolled face = same person already enrolled
+
+# Sighting log: every watchlist match with a cropped face thumbnail (see modules/sightings.py)
+SIGHTINGS_DIR = os.path.join(BASE_DIR, "sightings")
+sighting_dedup_seconds = 10.0  # Same person on the same source is recorded at most once per window
+sighting_thumbnail_cache_size = 256  # Thumbnails kept in memory; the rest are read back from disk
+sighting_log = None
+_sighting_log_lock = threading.Lock()
+
+
+def get_sighting_log():
+    """The sighting log, opened on first use (enrolment workers and the like never open it)."""
+    global sighting_log
+    with _sighting_log_lock:
+        if sighting_log is None:
+            sighting_log = SightingLog(
+                SIGHTINGS_DIR,
+                dedup_seconds=sighting_dedup_seconds,
+                cache_size=sighting_thumbnail_cache_size,
+            )
+    return sighting_log
@@ -1,64 +1,133 @@
+import time
 import cv2
-import torch
 import numpy as np
+import config
+import profiling
+from frame_pool import FramePool
+from heatmap import DensityHeatmap
+from line_counter import LineCounter, add_crossings
+from streaming import multipart_stream, get_publisher
 from tracker import Tracker
-from config import camera, model, tracker, area, crowd_count, weapon_detected
-import time
+from config import area
+
 
-crowd_count = 0
 # Add this reset function to reset the crowd count
-def reset_crowd_count():
-    global crowd_count
-    crowd_count = 0
+def reset_crowd_count(source_id=config.DEFAULT_SOURCE_ID):
+    config.state.set(f"crowd_count:{source_id}", 0)
 
-def get_weapon_status():
-    global weapon_detected
-    return weapon_detected
+def get_weapon_status(source_id=config.DEFAULT_SOURCE_ID):
+    return config.state.get(f"weapon_detected:{source_id}", config.STATE_DEFAULTS["weapon_detected"])
 
 # Function to get the latest crowd count
-def get_crowd_count():
-    global crowd_count
-    return crowd_count
-# Define a function to handle crowd frame generation with frame skipping and optimization
-def generate_crowd_frame():
-    global crowd_count,weapon_detected
+def get_crowd_count(source_id=config.DEFAULT_SOURCE_ID):
+    return config.state.get(f"crowd_count:{source_id}", config.STATE_DEFAULTS["crowd_count"])
+
+# Run detection and tracking on one source's frames, with frame skipping and optimization
+def run_crowd_analysis(frames, source_id=config.DEFAULT_SOURCE_ID, skip_by_frame_number=False):
+    """Consume (frame_number, frame) pairs from a source and publish its count, weapon flag and annotated frame.
+
+    With ``skip_by_frame_number`` (file sources, whose numbers are positions in the
+    file) the analysed frames are chosen by number, so every run over a file analyses
+    the same frames whatever the start offset or seeks.
+    """
+    model = config.load_model()
+    tracker = Tracker()  # IDs are only meaningful within one source
+    pool = FramePool(max_buffers=4)  # Resized frames; the overlay is drawn on these, never on the source frame
+    heatmap = DensityHeatmap(
+        source_id,
+        frame_size=(640, 320),
+        cell_size=config.heatmap_cell_size,
+        half_life=config.heatmap_half_life,
+        bucket_seconds=config.heatmap_bucket_seconds,
+        buckets=config.heatmap_buckets,
+        publish_change=config.heatmap_publish_change,
+    )
+    counter = LineCounter(frame_size=(640, 320))
+    lines_key, counts_key, events_key = f"count_lines:{source_id}", f"line_counts:{source_id}", f"events:{source_id}"
+    lines_version = counts_version = 0
+    line_totals, last_event = {}, None
+    resized = None  # Pooled buffer of the frame being processed, released when the next one starts
     frame_skip = 3  # Process every 3rd frame to reduce load
     frame_counter = 0
 
-    while True:
-        success, frame = camera.read()
-        if not success:
-            break
-
+    for frame_number, frame in frames:
         # Skip frames to reduce processing load
         frame_counter += 1
-        if frame_counter % frame_skip != 0:
+        if (frame_number if skip_by_frame_number else frame_counter) % frame_skip != 0:
             continue  # Skip this frame
 
-        # Resize the frame (optional: reduce resolution further if needed)
-        frame = cv2.resize(frame, (640, 320))
-        cv2.polylines(frame, [np.array(area, np.int32)], True, (0, 255, 0), 3)
+        # Stage timings are recorded only while a profile is running (/admin/profile)
+        with profiling.frame("crowd", source_id, frame_number):
+            # Resize the frame (optional: reduce resolution further if needed)
+            with profiling.stage("resize"):
+                pool.release(resized)  # The previous frame was encoded and published already
+                resized = pool.acquire((320, 640, 3))
+                frame = cv2.resize(frame, (640, 320), dst=resized)
+                cv2.polylines(frame, [np.array(area, np.int32)], True, (0, 255, 0), 3)
+
+            with profiling.stage("model"):
+                with config.model_lock:
+                    results = model(frame)
+            list = []
+            weapon_detect = False
+
+            with profiling.stage("postprocess"):
+                for index, row in results.pandas().xyxy[0].iterrows():
+                    x1, y1, x2, y2 = int(row['xmin']), int(row['ymin']), int(row['xmax']), int(row['ymax'])
+                    obj_name = str(row['name'])
+                    if obj_name == 'person':
+                        list.append([x1, y1, x2, y2])
+                    elif obj_name == 'gun':
+                        weapon_detect = True
+                        cv2.putText(frame, "Weapon Detected", (785, 39), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (0, 0, 200), 2)
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            with profiling.stage("tracker"):
+                boxes_id = tracker.update(list)
+            with profiling.stage("heatmap"):
+                heatmap.add(list)
+            with profiling.stage("lines"):
+                # Lines are edited through /sources/<id>/lines; pick up changes between frames
+                lines, lines_version = config.state.get_if_newer(lines_key, lines_version)
+                if lines is not None:
+                    counter.set_lines(lines)
+                crossings = counter.update(boxes_id)
+                totals, counts_version = config.state.get_if_newer(counts_key, counts_version)
+                if totals is not None:
+                    line_totals = totals  # Reset or pruned by the API
+
+            # Publish count, weapon flag and the annotated frame together so readers see a consistent snapshot
+            with profiling.stage("imencode"):
+                ret, buffer = cv2.imencode('.jpg', frame)
+            if not ret:
+                continue
+            with profiling.stage("publish"):
+                values = {
+                    f"crowd_count:{source_id}": len(boxes_id),
+                    f"weapon_detected:{source_id}": weapon_detect,
+                    f"frame:crowd:{source_id}": buffer.data,  # Stored straight from the encoder's buffer
+                    f"frame_number:{source_id}": frame_number,  # Position in the file for recorded sources
+                }
+                values.update(heatmap.publish_values())  # Empty unless the heatmap changed enough
+                event = {"crowd_count": len(boxes_id), "weapon_detected": weapon_detect, "lines": line_totals}
 
-        results = model(frame)
-        list = []
-        weapon_detected = False
-        weapon_detect = False
+                if crossings:
+                    # Add to the stored totals in the same transaction as the frame, so a
+                    # concurrent reset from the API is never overwritten with stale totals
+                    def publish(current):
+                        event["lines"] = add_crossings(current[counts_key], crossings)
+                        return dict(values, **{
+                            counts_key: event["lines"],
+                            events_key: dict(event, crossings=crossings, t=time.time()),
+                        })
 
-        for index, row in results.pandas().xyxy[0].iterrows():
-            x1, y1, x2, y2 = int(row['xmin']), int(row['ymin']), int(row['xmax']), int(row['ymax'])
-            obj_name = str(row['name'])
-            if obj_name == 'person':
-                list.append([x1, y1, x2, y2])
-            elif obj_name == 'gun':
-                weapon_detect = True
-                cv2.putText(frame, "Weapon Detected", (785, 39), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (0, 0, 200), 2)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-        weapon_detected= weapon_detect
-        boxes_id = tracker.update(list)
-        crowd_count = len(boxes_id)
+                    line_totals = config.state.update_many([counts_key], publish, {counts_key: {}})[counts_key]
+                    last_event = event
+                else:
+                    if event != last_event:  # Push channel: only when something a client shows changed
+                        values[events_key] = dict(event, crossings={}, t=time.time())
+                        last_event = event
+                    config.state.set_many(values)
 
-        # Encode frame to JPEG and yield as multipart stream
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+# Serve the frames published by run_crowd_analysis to any number of viewers
+def generate_crowd_frame(source_id=config.DEFAULT_SOURCE_ID):
+    return multipart_stream(get_publisher(config.state, f"frame:crowd:{source_id}").frames())
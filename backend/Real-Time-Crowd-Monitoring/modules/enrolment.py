@@ -0,0 +1,164 @@
+import io
+import os
+import time
+import uuid
+import zipfile
+import threading
+import numpy as np
+import face_recognition
+import config
+from known_faces import (
+    IMAGE_EXTENSIONS, encode_face_images, safe_face_name, add_known_faces, read_known_faces, remember_encodings,
+)
+
+
+def read_archive(data):
+    """Return ``[(filename, bytes)]`` for the images in a zip archive, and a list of skipped entries."""
+    files, skipped = [], []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or os.path.basename(member.filename).startswith("."):
+                continue
+            if not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                skipped.append({"file": member.filename, "status": "rejected", "reason": "not_an_image"})
+            elif member.file_size > config.enrol_max_file_bytes:
+                skipped.append({"file": member.filename, "status": "rejected", "reason": "too_large"})
+            else:
+                files.append((member.filename, archive.read(member)))
+    return files, skipped
+
+
+def _job_key(job_id):
+    return f"enrol_job:{job_id}"
+
+
+def get_job(job_id):
+    """Return the status and report of an enrolment job (any API worker can answer)."""
+    return config.state.get(_job_key(job_id))
+
+
+def start_enrolment(files, skipped=None):
+    """Start a bulk enrolment job for ``[(filename, bytes)]`` and return its id."""
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "total": len(files) + len(skipped or []),
+        "processed": len(skipped or []),
+        "accepted": 0,
+        "rejected": len(skipped or []),
+        "report": list(skipped or []),
+        "created": time.time(),
+        "finished": None,
+    }
+    config.state.set(_job_key(job_id), job)
+    threading.Thread(target=_run_job, args=(job, files), name=f"enrol-{job_id}", daemon=True).start()
+    return job_id
+
+
+def _run_job(job, files):
+    try:
+        _enrol(job, files)
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        print(f"Error in enrolment job {job['id']}: {e}")
+    job["finished"] = time.time()
+    config.state.set(_job_key(job["id"]), job)
+
+
+def _reject(job, filename, reason, **details):
+    job["report"].append(dict({"file": filename, "status": "rejected", "reason": reason}, **details))
+    job["rejected"] += 1
+    job["processed"] += 1
+
+
+def _closest(encodings, names, encoding):
+    """Name of the enrolled face closer than the duplicate threshold, if any."""
+    if not len(encodings):
+        return None
+    distances = face_recognition.face_distance(encodings, encoding)
+    best = int(np.argmin(distances))
+    return names[best] if distances[best] < config.enrol_duplicate_distance else None
+
+
+def _enrol(job, files):
+    job["status"] = "encoding"
+    gallery_encodings, gallery_names, _ = read_known_faces()
+    known_names = {name.lower() for name in gallery_names}
+    if os.path.isdir(config.KNOWN_FACES_DIR):
+        # Files in the folder without a usable face still own their name on disk
+        known_names.update(os.path.splitext(f)[0].lower() for f in os.listdir(config.KNOWN_FACES_DIR))
+
+    # Name checks are cheap: reject duplicate identities before spending any dlib time.
+    # Pool items are labelled by position, as archives may repeat a file name in two folders.
+    items, names = [], {}
+    for position, (filename, data) in enumerate(files):
+        name = safe_face_name(filename)
+        if name.lower() in known_names:
+            _reject(job, filename, "duplicate_identity", name=name, matches=name)
+            continue
+        known_names.add(name.lower())
+        names[position] = name
+        items.append((position, data))
+
+    accepted_encodings, accepted_names, accepted_positions, accepted_reports = [], [], [], []
+    last_published = time.time()
+
+    for result in encode_face_images(items):
+        position = result["file"]
+        filename, name = files[position][0], names[position]
+        if result["status"] != "ok":
+            details = {"faces": result["faces"]} if "faces" in result else {}
+            _reject(job, filename, result["status"], name=name, **details)
+        else:
+            encoding = np.asarray(result["encoding"], dtype=np.float64)
+            # The same person already enrolled (or earlier in this batch) under another name
+            match = _closest(gallery_encodings, gallery_names, encoding)
+            if match is None and accepted_encodings:
+                match = _closest(accepted_encodings, accepted_names, encoding)
+            if match is not None:
+                _reject(job, filename, "duplicate_identity", name=name, matches=match)
+            else:
+                accepted_encodings.append(encoding)
+                accepted_names.append(name)
+                accepted_positions.append(position)
+                accepted_reports.append({"file": filename, "status": "accepted", "name": name})
+                job["report"].append(accepted_reports[-1])
+                job["accepted"] += 1
+                job["processed"] += 1
+
+        if time.time() - last_published > 0.5:
+            config.state.set(_job_key(job["id"]), job)
+            last_published = time.time()
+
+    # Save the accepted images, then hand the matcher all new encodings in one atomic swap
+    job["status"] = "saving"
+    config.state.set(_job_key(job["id"]), job)
+    os.makedirs(config.KNOWN_FACES_DIR, exist_ok=True)
+    # /upload_face or another job may have enrolled a name since the checks above
+    taken = {os.path.splitext(f)[0].lower() for f in os.listdir(config.KNOWN_FACES_DIR)}
+    saved, saved_encodings, saved_names = {}, [], []
+    for position, name, encoding, report in zip(
+        accepted_positions, accepted_names, accepted_encodings, accepted_reports
+    ):
+        filename, data = files[position]
+        ext = os.path.splitext(filename)[1].lower()
+        saved_filename = f"{name}{ext if ext in IMAGE_EXTENSIONS else '.jpg'}"
+        try:
+            if name.lower() in taken:
+                raise FileExistsError(saved_filename)
+            with open(os.path.join(config.KNOWN_FACES_DIR, saved_filename), "xb") as image_file:
+                image_file.write(data)
+        except FileExistsError:
+            report.update(status="rejected", reason="duplicate_identity", matches=name)
+            job["accepted"] -= 1
+            job["rejected"] += 1
+            continue
+        saved[saved_filename] = encoding.tolist()
+        saved_encodings.append(encoding)
+        saved_names.append(name)
+    if saved_encodings:
+        job["total_faces"] = add_known_faces(saved_encodings, saved_names)
+        remember_encodings(saved)
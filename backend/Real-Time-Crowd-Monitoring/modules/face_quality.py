@@ -0,0 +1,194 @@
+import time
+import threading
+import numpy as np
+import cv2
+import face_recognition
+
+GATE_REASONS = ("too_small", "too_dark", "too_bright", "blurry", "profile")
+
+# Histogram bin edges of the reported score distributions
+_BINS = {
+    "size": [0, 20, 30, 40, 60, 80, 120, 160, 240, np.inf],
+    "sharpness": [0, 10, 20, 40, 80, 160, 320, 640, np.inf],
+    "brightness": [0, 32, 64, 96, 128, 160, 192, 224, 256],
+    "yaw": [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0001],
+    "quality": [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0001],
+}
+
+
+def face_pose(rgb_frame, box):
+    """Yaw asymmetry from the 5-point landmarks: 0 for a frontal face, towards 1 side-on."""
+    landmarks = face_recognition.face_landmarks(rgb_frame, [box], model="small")
+    if not landmarks:
+        return 1.0
+    points = landmarks[0]
+    nose = np.mean(points["nose_tip"], axis=0)[0]
+    eye_a = np.mean(points["left_eye"], axis=0)[0]
+    eye_b = np.mean(points["right_eye"], axis=0)[0]
+    distance_a, distance_b = abs(nose - eye_a), abs(eye_b - nose)
+    if distance_a + distance_b == 0:
+        return 1.0
+    return float(abs(distance_a - distance_b) / (distance_a + distance_b))
+
+
+class FaceQualityGate:
+    """Decide per detected face whether it is worth a dlib encoding right now.
+
+    Faces are scored on size (shorter box side in pixels), sharpness (variance of the
+    Laplacian of the face resized to 64x64), brightness (mean grey level) and pose
+    (yaw asymmetry of the 5-point landmarks). Checks run cheapest first and the
+    landmark fit only happens for faces that passed the others.
+
+    Faces below the thresholds are not encoded. Detections are followed across frames
+    as tracks; a track keeps its best-scoring crop, and if the track ends without
+    ever passing the gate that crop is handed back once for a late encoding (if it is
+    at least ``defer_min_size`` pixels), so a person who never faced the camera
+    squarely still gets one match attempt at their best moment.
+    """
+
+    def __init__(self, min_size=40, min_sharpness=40.0, brightness_range=(40, 220), max_yaw=0.35,
+                 defer_seconds=1.0, defer_min_size=24, margin=0.25, pose=face_pose):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.brightness_range = brightness_range
+        self.max_yaw = max_yaw
+        self.defer_seconds = defer_seconds
+        self.defer_min_size = defer_min_size
+        self.margin = margin
+        self.pose = pose
+
+        self._tracks = {}
+        self._next_track = 0
+        self._lock = threading.Lock()
+        self._counts = {"detected": 0, "encoded": 0, "deferred_encoded": 0, "dropped": 0}
+        self._gated = dict.fromkeys(GATE_REASONS, 0)
+        self._histograms = {name: np.zeros(len(edges) - 1, dtype=np.int64) for name, edges in _BINS.items()}
+
+    def score(self, rgb_frame, box):
+        """Return ``(scores, reason)``; reason is None when the face passes the gate."""
+        top, right, bottom, left = box
+        size = min(bottom - top, right - left)
+        scores = {"size": float(size)}
+        if size < self.min_size:
+            return scores, "too_small"
+
+        face = rgb_frame[max(0, top):bottom, max(0, left):right]
+        grey = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+        scores["brightness"] = float(grey.mean())
+        if scores["brightness"] < self.brightness_range[0]:
+            return scores, "too_dark"
+        if scores["brightness"] > self.brightness_range[1]:
+            return scores, "too_bright"
+
+        grey = cv2.resize(grey, (64, 64), interpolation=cv2.INTER_AREA)
+        scores["sharpness"] = float(cv2.Laplacian(grey, cv2.CV_64F).var())
+        if scores["sharpness"] < self.min_sharpness:
+            return scores, "blurry"
+
+        scores["yaw"] = self.pose(rgb_frame, box)
+        if scores["yaw"] > self.max_yaw:
+            return scores, "profile"
+        return scores, None
+
+    def quality(self, scores):
+        """Single 0..1 score for ranking crops of the same face (missing checks count as 0)."""
+        size = min(scores["size"] / (2 * self.min_size), 1.0)
+        sharpness = min(scores.get("sharpness", 0.0) / (4 * self.min_sharpness), 1.0)
+        brightness = 1.0 - min(abs(scores.get("brightness", 0.0) - 128.0) / 128.0, 1.0)
+        pose = 1.0 - min(scores.get("yaw", 1.0), 1.0)
+        return size * (0.25 + 0.75 * sharpness) * (0.5 + 0.5 * brightness) * (0.25 + 0.75 * pose)
+
+    def _crop(self, rgb_frame, box):
+        """Copy of the face with a margin, and the face box relative to the copy."""
+        top, right, bottom, left = box
+        pad_y, pad_x = int((bottom - top) * self.margin), int((right - left) * self.margin)
+        height, width = rgb_frame.shape[:2]
+        y0, x0 = max(0, top - pad_y), max(0, left - pad_x)
+        crop = rgb_frame[y0:min(height, bottom + pad_y), x0:min(width, right + pad_x)].copy()
+        return crop, (top - y0, right - x0, bottom - y0, left - x0)
+
+    def _track_for(self, box, now):
+        top, right, bottom, left = box
+        centre = ((left + right) / 2, (top + bottom) / 2)
+        reach = max(right - left, bottom - top) * 0.6
+        for track_id, track in self._tracks.items():
+            if track["seen"] == now:
+                continue  # Already matched to another face of this frame
+            if np.hypot(centre[0] - track["centre"][0], centre[1] - track["centre"][1]) < reach:
+                track["centre"], track["seen"] = centre, now
+                return track
+        track = {"centre": centre, "seen": now, "encoded": False, "best": -1.0, "crop": None}
+        self._tracks[self._next_track] = track
+        self._next_track += 1
+        return track
+
+    def update(self, rgb_frame, face_locations, now=None):
+        """Gate one frame's detections.
+
+        Returns ``(accepted, gated, deferred)``: the locations to encode now, the
+        ``(location, reason)`` pairs skipped, and ``(crop, box)`` pairs of ended tracks
+        whose best crop should be encoded late.
+        """
+        now = time.time() if now is None else now
+        accepted, gated = [], []
+        with self._lock:
+            for box in face_locations:
+                scores, reason = self.score(rgb_frame, box)
+                quality = self.quality(scores)
+                scores["quality"] = quality
+                self._record(scores, reason)
+                track = self._track_for(box, now)
+                if reason is None:
+                    accepted.append(box)
+                    track["encoded"], track["crop"] = True, None
+                    self._counts["encoded"] += 1
+                else:
+                    gated.append((box, reason))
+                    if not track["encoded"] and quality > track["best"] and scores["size"] >= self.defer_min_size:
+                        track["best"] = quality
+                        track["crop"] = self._crop(rgb_frame, box)
+            deferred = self._expire(now)
+        return accepted, gated, deferred
+
+    def _expire(self, now):
+        deferred = []
+        for track_id in [t for t, track in self._tracks.items() if now - track["seen"] > self.defer_seconds]:
+            track = self._tracks.pop(track_id)
+            if track["encoded"]:
+                continue
+            if track["crop"] is not None:
+                deferred.append(track["crop"])
+                self._counts["deferred_encoded"] += 1
+            else:
+                self._counts["dropped"] += 1
+        return deferred
+
+    def _record(self, scores, reason):
+        self._counts["detected"] += 1
+        if reason is not None:
+            self._gated[reason] += 1
+        for name, value in scores.items():
+            bin_index = int(np.searchsorted(_BINS[name], value, side="right")) - 1
+            self._histograms[name][min(max(bin_index, 0), len(self._histograms[name]) - 1)] += 1
+
+    def stats(self):
+        """Counts, gate reasons and score histograms since start."""
+        with self._lock:
+            detected = self._counts["detected"]
+            encodings = self._counts["encoded"] + self._counts["deferred_encoded"]
+            return {
+                "counts": dict(self._counts),
+                "gated": dict(self._gated),
+                "encodings_saved": round(1 - encodings / detected, 4) if detected else 0.0,
+                "histograms": {
+                    name: {"edges": [float(edge) if np.isfinite(edge) else None for edge in _BINS[name]],
+                           "counts": counts.tolist()}
+                    for name, counts in self._histograms.items()
+                },
+                "thresholds": {
+                    "min_size": self.min_size,
+                    "min_sharpness": self.min_sharpness,
+                    "brightness_range": list(self.brightness_range),
+                    "max_yaw": self.max_yaw,
+                },
+            }
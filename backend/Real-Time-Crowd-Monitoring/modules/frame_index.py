@@ -0,0 +1,116 @@
+import os
+import hashlib
+import numpy as np
+import cv2
+
+
+class FrameIndex:
+    """Presentation timestamps and keyframe positions of one video file.
+
+    Built once per file (reading packets in raw mode where the OpenCV build supports
+    it, so nothing is decoded) and cached on disk keyed by path, size and mtime.
+    Frame numbers are positions in this index, so the same number always refers to
+    the same frame no matter where playback started.
+    """
+
+    def __init__(self, path, timestamps, keyframes, fps):
+        self.path = path
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)  # Seconds, one per frame
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)      # Frame numbers, ascending
+        self.fps = float(fps)
+
+    @property
+    def frame_count(self):
+        return len(self.timestamps)
+
+    @property
+    def keyframes_known(self):
+        """False when the build found no keyframe flags and marked every frame as one."""
+        return self.frame_count <= 1 or len(self.keyframes) < self.frame_count
+
+    @property
+    def duration(self):
+        if not self.frame_count:
+            return 0.0
+        return float(self.timestamps[-1]) + 1.0 / self.fps
+
+    def frame_at(self, seconds):
+        """Frame number showing at ``seconds`` into the file (clamped to the file)."""
+        number = int(np.searchsorted(self.timestamps, seconds, side="right")) - 1
+        return min(max(number, 0), max(self.frame_count - 1, 0))
+
+    def keyframe_before(self, number):
+        """Nearest keyframe at or before frame ``number``; decoding starts there on a seek."""
+        position = int(np.searchsorted(self.keyframes, number, side="right")) - 1
+        return int(self.keyframes[position]) if position >= 0 else 0
+
+    def summary(self):
+        return {
+            "path": self.path,
+            "frame_count": self.frame_count,
+            "fps": round(self.fps, 3),
+            "duration": round(self.duration, 3),
+            "keyframe_count": len(self.keyframes),
+        }
+
+    @staticmethod
+    def cache_path(path, cache_dir):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".npz")
+
+    @classmethod
+    def load(cls, path, cache_dir):
+        """Return the cached index of ``path``, or None if it has not been built yet."""
+        cached = cls.cache_path(path, cache_dir)
+        if not os.path.exists(cached):
+            return None
+        with np.load(cached) as data:
+            return cls(path, data["timestamps"], data["keyframes"], float(data["fps"]))
+
+    @classmethod
+    def load_or_build(cls, path, cache_dir):
+        index = cls.load(path, cache_dir)
+        if index is None:
+            index = cls.build(path)
+            os.makedirs(cache_dir, exist_ok=True)
+            cached = cls.cache_path(path, cache_dir)
+            np.savez(cached + ".tmp.npz", timestamps=index.timestamps, keyframes=index.keyframes, fps=index.fps)
+            os.replace(cached + ".tmp.npz", cached)  # Another process may be reading the cache
+            print(f"[INFO] Indexed {path}: {index.frame_count} frames, {len(index.keyframes)} keyframes")
+        return index
+
+    @classmethod
+    def build(cls, path):
+        capture = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+        if not capture.isOpened():
+            raise IOError(f"Cannot open video file: {path}")
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 25.0
+
+        # Raw mode hands back packets without decoding them
+        raw = capture.set(cv2.CAP_PROP_FORMAT, -1)
+        has_key_frame = getattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME", None)
+
+        timestamps = []
+        keyframes = []
+        number = 0
+        while capture.grab():
+            timestamps.append(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+            if has_key_frame is not None and raw:
+                if capture.get(has_key_frame) > 0:
+                    keyframes.append(number)
+            number += 1
+        capture.release()
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) and not np.all(np.diff(timestamps) >= 0):
+            # Packets come in decode order (B-frames); presentation order is sorted
+            timestamps = np.sort(timestamps)
+        if len(timestamps) > 1 and timestamps[-1] <= timestamps[0]:
+            timestamps = np.arange(len(timestamps)) / fps  # Backend reported no timestamps
+        if not keyframes:
+            # No keyframe information: treat every frame as a seek point (OpenCV then
+            # seeks to the real keyframe itself and decodes forward)
+            keyframes = list(range(len(timestamps)))
+        return cls(path, timestamps, keyframes, fps)
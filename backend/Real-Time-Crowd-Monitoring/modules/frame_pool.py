@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+
+
+class FramePool:
+    """Preallocated frame buffers, reused across frames instead of allocated per frame.
+
+    Decode, resize and colour conversion write into pooled buffers through OpenCV's
+    ``dst`` arguments. Ownership is explicit: ``acquire()`` hands out a buffer holding
+    one reference, every further holder takes one with ``retain()``, and each holder
+    gives its reference back with ``release()``. A buffer is handed out again only
+    once its last reference was released, so a consumer still holding a frame never
+    sees it overwritten; a holder that forgets to release only costs pool capacity.
+    When every buffer of a shape is in use and the pool is full, a plain array is
+    returned (counted as a miss) rather than blocking the pipeline. ``retain()`` and
+    ``release()`` ignore arrays that are not pooled buffers (misses, None).
+    """
+
+    def __init__(self, max_buffers=8):
+        self.max_buffers = max_buffers  # Per shape and dtype
+        self._buffers = {}  # (shape, dtype) -> pooled buffers
+        self._refs = {}     # id(buffer) -> references held outside the pool
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+        self.misses = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Return a buffer of ``shape`` owned by the caller until it calls release().
+
+        Its contents are undefined until written.
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            buffers = self._buffers.setdefault(key, [])
+            for buffer in buffers:
+                if not self._refs[id(buffer)]:
+                    self._refs[id(buffer)] = 1
+                    self.reused += 1
+                    return buffer
+            if len(buffers) < self.max_buffers:
+                buffer = np.empty(shape, dtype=dtype)
+                buffers.append(buffer)
+                self._refs[id(buffer)] = 1
+                self.allocated += 1
+                return buffer
+            self.misses += 1
+        return np.empty(shape, dtype=dtype)
+
+    def acquire_like(self, frame):
+        return self.acquire(frame.shape, frame.dtype)
+
+    def copy(self, frame):
+        """Copy ``frame`` into an acquired buffer (to draw overlays without touching the original)."""
+        buffer = self.acquire_like(frame)
+        np.copyto(buffer, frame)
+        return buffer
+
+    def retain(self, buffer):
+        """Take another reference to ``buffer`` for a new holder; returns the buffer."""
+        with self._lock:
+            if buffer is not None and id(buffer) in self._refs:
+                self._refs[id(buffer)] += 1
+        return buffer
+
+    def release(self, buffer):
+        """Give back one reference; the buffer is reused once none is left."""
+        with self._lock:
+            if buffer is not None and self._refs.get(id(buffer)):
+                self._refs[id(buffer)] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffers": sum(len(buffers) for buffers in self._buffers.values()),
+                "in_use": sum(1 for refs in self._refs.values() if refs),
+                "allocated": self.allocated,
+                "reused": self.reused,
+                "misses": self.misses,
+            }
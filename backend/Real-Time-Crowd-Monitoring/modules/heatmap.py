@@ -0,0 +1,233 @@
+import math
+import time
+import threading
+import numpy as np
+import cv2
+
+
+def _heatmap_keys(source_id):
+    return f"heatmap:{source_id}", f"heatmap_live:{source_id}", f"heatmap_bucket:{source_id}:current"
+
+
+class DensityHeatmap:
+    """Where people stand on one source, kept as a low-resolution occupancy grid.
+
+    Each detected person adds the time since the previous analysed frame to the grid
+    cell under their feet, so cells hold person-seconds. Two grids are maintained:
+
+    live     decays exponentially with ``half_life``. Instead of multiplying the whole
+             grid every frame, new weights are scaled up by exp(rate * t) and the grid
+             is renormalised only when that factor gets large, so a frame costs
+             O(detections) (one scatter-add).
+    buckets  undecayed sums per ``bucket_seconds``; the last ``buckets`` closed ones
+             are kept for time-windowed views.
+
+    Runs in the analysis process. ``publish_values()`` returns store values only when
+    the live grid changed by more than ``publish_change`` (fraction of its mass) or a
+    bucket closed, so readers re-render only then.
+    """
+
+    def __init__(self, source_id, frame_size=(640, 320), cell_size=8, half_life=60.0,
+                 bucket_seconds=60.0, buckets=60, publish_change=0.05, publish_interval=1.0):
+        self.source_id = source_id
+        self.frame_size = frame_size  # (width, height) of the frames the boxes refer to
+        self.cell_size = cell_size
+        self.shape = (math.ceil(frame_size[1] / cell_size), math.ceil(frame_size[0] / cell_size))
+        self.half_life = half_life
+        self.rate = math.log(2) / half_life
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.publish_change = publish_change
+        self.publish_interval = publish_interval
+
+        self._live = np.zeros(self.shape, dtype=np.float64)  # Scaled by exp(rate * (t - _reference))
+        self._reference = None  # Set by the first frame
+        self._bucket = np.zeros(self.shape, dtype=np.float32)
+        self._bucket_start = None
+        self._closed = {}  # slot -> start time of the closed buckets still retained
+        self._pending = {}  # Closed bucket blobs waiting for the next publish
+        self._last_frame = None
+        self._mass = 0.0  # Scaled mass of the live grid
+        self._mass_published = 0.0
+        self._last_publish = 0.0
+
+    def _bucket_floor(self, t):
+        return math.floor(t / self.bucket_seconds) * self.bucket_seconds
+
+    def _roll_bucket(self, now):
+        start = self._bucket_floor(now)
+        if self._bucket_start is None:
+            self._bucket_start = start
+        if start == self._bucket_start:
+            return
+        slot = int(self._bucket_start // self.bucket_seconds) % self.buckets
+        self._pending[f"heatmap_bucket:{self.source_id}:{slot}"] = self._bucket.tobytes()
+        self._closed[str(slot)] = self._bucket_start
+        oldest = start - self.buckets * self.bucket_seconds
+        self._closed = {s: t for s, t in self._closed.items() if t >= oldest}
+        self._bucket.fill(0)
+        self._bucket_start = start
+
+    def add(self, boxes, now=None):
+        """Add one analysed frame's person boxes ``[x1, y1, x2, y2]``."""
+        now = time.time() if now is None else now
+        if self._reference is None:
+            self._reference = now
+        self._roll_bucket(now)
+        # Person-seconds: weight each detection by the frame interval (capped after a stall)
+        weight = 0.0 if self._last_frame is None else min(now - self._last_frame, 1.0)
+        self._last_frame = now
+        if not len(boxes) or weight <= 0:
+            return
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        feet_x = (boxes[:, 0] + boxes[:, 2]) * 0.5
+        feet_y = boxes[:, 3] - 1
+        cols = np.clip((feet_x // self.cell_size).astype(np.intp), 0, self.shape[1] - 1)
+        rows = np.clip((feet_y // self.cell_size).astype(np.intp), 0, self.shape[0] - 1)
+
+        exponent = self.rate * (now - self._reference)
+        if exponent > 30:
+            # Renormalise before the scale factor loses precision (rare, O(cells))
+            self._live *= math.exp(-exponent)
+            self._mass *= math.exp(-exponent)
+            self._mass_published *= math.exp(-exponent)
+            self._reference = now
+            exponent = 0.0
+        scaled = weight * math.exp(exponent)
+        np.add.at(self._live, (rows, cols), scaled)
+        np.add.at(self._bucket, (rows, cols), weight)
+        self._mass += scaled * len(boxes)
+
+    def publish_values(self, now=None):
+        """Store values to publish now, or {} when the grid has not changed enough."""
+        now = time.time() if now is None else now
+        if self._reference is None:
+            return {}
+        self._roll_bucket(now)
+        changed = self._mass - self._mass_published
+        significant = changed > self.publish_change * max(self._mass, 1e-9)
+        if not self._pending and not (significant and now - self._last_publish >= self.publish_interval):
+            return {}
+
+        meta_key, live_key, current_key = _heatmap_keys(self.source_id)
+        values = dict(self._pending)
+        values.update({
+            meta_key: {
+                "shape": list(self.shape),
+                "cell_size": self.cell_size,
+                "frame_size": list(self.frame_size),
+                "half_life": self.half_life,
+                "bucket_seconds": self.bucket_seconds,
+                "published": now,
+                "current_bucket_start": self._bucket_start,
+                "buckets": self._closed,
+            },
+            # Live grid as of ``published``; readers apply the decay since then
+            live_key: (self._live * math.exp(-self.rate * (now - self._reference))).astype(np.float32).tobytes(),
+            current_key: self._bucket.tobytes(),
+        })
+        self._pending = {}
+        self._mass_published = self._mass
+        self._last_publish = now
+        return values
+
+
+def read_heatmap(state, source_id, window=None, now=None):
+    """Return ``(grid, meta)`` for a source, or ``(None, None)`` if it has no heatmap yet.
+
+    Without ``window`` the grid is the live, decayed occupancy; with ``window`` seconds
+    it is the undecayed person-seconds of the buckets overlapping the last ``window``.
+    """
+    now = time.time() if now is None else now
+    meta_key, live_key, current_key = _heatmap_keys(source_id)
+    snapshot = state.snapshot([meta_key, live_key])
+    meta = snapshot[meta_key]
+    if meta is None:
+        return None, None
+    shape = tuple(meta["shape"])
+
+    if window is None:
+        grid = np.frombuffer(snapshot[live_key], dtype=np.float32).reshape(shape)
+        return grid * np.float32(0.5 ** ((now - meta["published"]) / meta["half_life"])), meta
+
+    since = now - window
+    slots = [slot for slot, start in meta["buckets"].items() if start + meta["bucket_seconds"] > since]
+    keys = [current_key] + [f"heatmap_bucket:{source_id}:{slot}" for slot in slots]
+    blobs = state.snapshot(keys)
+    grid = np.zeros(shape, dtype=np.float32)
+    for raw in blobs.values():
+        if raw is not None:
+            grid += np.frombuffer(raw, dtype=np.float32).reshape(shape)
+    return grid, meta
+
+
+def render_heatmap(grid, frame_size, image_format="png", background=None):
+    """Render a grid as an overlay image of ``frame_size``.
+
+    "png" is a transparent RGBA overlay (alpha follows density) to lay over the video;
+    "jpeg" is the colour map blended onto ``background`` (JPEG bytes) when given.
+    """
+    peak = float(np.percentile(grid, 99.5)) if grid.any() else 0.0
+    normalised = np.clip(grid / peak, 0, 1) if peak > 0 else np.zeros_like(grid)
+    normalised = cv2.GaussianBlur(normalised.astype(np.float32), (3, 3), 0)
+    normalised = cv2.resize(normalised, tuple(frame_size), interpolation=cv2.INTER_CUBIC)
+    levels = np.clip(normalised * 255, 0, 255).astype(np.uint8)
+    colours = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
+
+    if image_format == "png":
+        alpha = np.clip(levels.astype(np.uint16) * 3 // 2, 0, 200).astype(np.uint8)
+        ret, buffer = cv2.imencode('.png', np.dstack([colours, alpha]))
+    else:
+        image = colours
+        if background is not None:
+            frame = cv2.imdecode(np.frombuffer(background, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                frame = cv2.resize(frame, tuple(frame_size))
+                weight = (normalised[..., None] * 0.6).astype(np.float32)
+                image = (frame * (1 - weight) + colours * weight).astype(np.uint8)
+        ret, buffer = cv2.imencode('.jpg', image)
+    return buffer.tobytes() if ret else None
+
+
+class HeatmapRenderCache:
+    """Rendered heatmap images per (source, format, window), rebuilt only when the
+    analysis process republished the grid (and, for windows, when a bucket closes).
+
+    Live renders are normalised, so plain decay between publishes would not change
+    them; only new detections (published once they moved the grid enough) do.
+    """
+
+    def __init__(self, state, max_entries=64):
+        self.state = state
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, source_id, image_format="png", window=None):
+        meta_key = _heatmap_keys(source_id)[0]
+        key = (source_id, image_format, window)
+        with self._lock:
+            cached = self._entries.get(key)
+        version = cached[0] if cached else 0
+        _, latest_version = self.state.get_if_newer(meta_key, version)
+
+        now = time.time()
+        window_slot = None
+        if window is not None and cached is not None:
+            window_slot = int(now // cached[2]["bucket_seconds"])
+        if cached and latest_version == version and window_slot == cached[3]:
+            return cached[1]
+
+        grid, meta = read_heatmap(self.state, source_id, window, now)
+        if grid is None:
+            return None
+        background = self.state.get(f"frame:crowd:{source_id}") if image_format == "jpeg" else None
+        image = render_heatmap(grid, meta["frame_size"], image_format, background)
+        if window is not None:
+            window_slot = int(now // meta["bucket_seconds"])
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (latest_version, image, meta, window_slot)
+        return image
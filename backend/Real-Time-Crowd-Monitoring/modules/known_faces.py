@@ -0,0 +1,178 @@
+import io
+import os
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import face_recognition
+import config
+
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
+
+# Encoding cache of the known_faces folder: file name -> (mtime, encoding), so a reload
+# only encodes files that are new or changed
+_CACHE_FILE = ".encodings.npz"
+
+_pool = None
+
+
+def get_pool():
+    """Process pool for face decoding and encoding (dlib holds the GIL per image)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=config.enrol_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def encode_face_image(item):
+    """Decode one image and encode its face. Runs in a pool worker.
+
+    ``item`` is ``(label, source)`` where source is a file path or the image bytes.
+    Returns ``{"file": label, "status": ..., "encoding": list or None}`` with status
+    "ok", "no_face", "multiple_faces" or "unreadable". For "multiple_faces" the
+    encoding is that of the largest face.
+    """
+    label, source = item
+    try:
+        image = face_recognition.load_image_file(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except Exception as e:
+        return {"file": label, "status": "unreadable", "error": str(e), "encoding": None}
+
+    face_locations = face_recognition.face_locations(image, model="hog")
+    if not face_locations:
+        return {"file": label, "status": "no_face", "encoding": None}
+    # Largest face first: (bottom - top) * (right - left)
+    face_locations.sort(key=lambda box: (box[2] - box[0]) * (box[1] - box[3]), reverse=True)
+    encoding = face_recognition.face_encodings(image, known_face_locations=face_locations[:1], num_jitters=0)[0]
+    if len(face_locations) > 1:
+        return {"file": label, "status": "multiple_faces", "faces": len(face_locations), "encoding": encoding.tolist()}
+    return {"file": label, "status": "ok", "encoding": encoding.tolist()}
+
+
+def encode_face_images(items, on_result=None):
+    """Encode many images in the process pool, yielding results in input order."""
+    chunksize = max(1, len(items) // (config.enrol_workers * 4))
+    for result in get_pool().map(encode_face_image, items, chunksize=chunksize):
+        if on_result is not None:
+            on_result(result)
+        yield result
+
+
+def safe_face_name(filename, default="uploaded_person"):
+    """Identity name from an uploaded file name: special characters replaced, no extension."""
+    name_without_ext = os.path.splitext(os.path.basename(filename))[0]
+    # Clean filename: remove special characters, keep only alphanumeric and spaces
+    safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in name_without_ext)
+    return safe_name.strip() or default
+
+
+def publish_known_faces(encodings, names):
+    """Swap the gallery seen by the analysis process in one atomic write."""
+    config.state.set_many({
+        "known_faces_encoding": np.asarray(encodings, dtype=np.float64).reshape(-1, 128).tobytes(),
+        "known_faces_name": list(names),
+        "known_faces_version": uuid.uuid4().hex,
+    })
+
+
+def add_known_faces(encodings, names):
+    """Append faces to the published gallery in one atomic swap. Returns the new gallery size."""
+    def append(gallery):
+        raw = gallery["known_faces_encoding"] or b""
+        return {
+            "known_faces_encoding": raw + np.asarray(encodings, dtype=np.float64).reshape(-1, 128).tobytes(),
+            "known_faces_name": list(gallery["known_faces_name"] or []) + list(names),
+            "known_faces_version": uuid.uuid4().hex,
+        }
+
+    gallery = config.state.update_many(
+        ["known_faces_encoding", "known_faces_name", "known_faces_version"], append, config.STATE_DEFAULTS
+    )
+    return len(gallery["known_faces_name"])
+
+
+def read_known_faces():
+    """Return ``(encodings, names, version)`` from one consistent snapshot of the store."""
+    snapshot = config.state.snapshot(
+        ["known_faces_encoding", "known_faces_name", "known_faces_version"],
+        defaults=config.STATE_DEFAULTS,
+    )
+    raw = snapshot["known_faces_encoding"] or b""
+    encodings = np.frombuffer(raw, dtype=np.float64).reshape(-1, 128)
+    return encodings, snapshot["known_faces_name"], snapshot["known_faces_version"]
+
+
+def _load_cache(known_faces_dir):
+    path = os.path.join(known_faces_dir, _CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as data:
+            return {
+                str(filename): (float(mtime), encoding)
+                for filename, mtime, encoding in zip(data["files"], data["mtimes"], data["encodings"])
+            }
+    except Exception as e:
+        print(f"Error reading face encoding cache: {e}")
+        return {}
+
+
+def _save_cache(known_faces_dir, cache):
+    files = sorted(cache)
+    path = os.path.join(known_faces_dir, _CACHE_FILE)
+    np.savez(
+        path + ".tmp.npz",
+        files=np.array(files, dtype=str),
+        mtimes=np.array([cache[f][0] for f in files], dtype=np.float64),
+        encodings=np.array([cache[f][1] for f in files], dtype=np.float64).reshape(-1, 128),
+    )
+    os.replace(path + ".tmp.npz", path)
+
+
+def remember_encodings(encodings_by_file):
+    """Add encodings of files just saved to the folder, so the next reload skips them."""
+    known_faces_dir = config.KNOWN_FACES_DIR
+    cache = _load_cache(known_faces_dir)
+    for filename, encoding in encodings_by_file.items():
+        cache[filename] = (os.path.getmtime(os.path.join(known_faces_dir, filename)), encoding)
+    _save_cache(known_faces_dir, cache)
+
+
+def load_known_faces_from_folder():
+    """Load all known faces from the known_faces folder and publish them. Returns the count.
+
+    Encodings of unchanged files come from the folder's encoding cache; new or changed
+    files are encoded in the process pool.
+    """
+    known_faces_dir = config.KNOWN_FACES_DIR
+    os.makedirs(known_faces_dir, exist_ok=True)
+
+    cache = _load_cache(known_faces_dir)
+    current = {}
+    to_encode = []
+    for filename in sorted(os.listdir(known_faces_dir)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            mtime = os.path.getmtime(os.path.join(known_faces_dir, filename))
+            cached = cache.get(filename)
+            if cached is not None and cached[0] == mtime:
+                current[filename] = cached
+            else:
+                to_encode.append((filename, os.path.join(known_faces_dir, filename)))
+
+    for result in encode_face_images(to_encode):
+        if result["encoding"] is not None:  # Group photos in the folder keep their largest face
+            filename = result["file"]
+            current[filename] = (os.path.getmtime(os.path.join(known_faces_dir, filename)), result["encoding"])
+        else:
+            print(f"Error loading face from {result['file']}: {result['status']}")
+
+    if to_encode or len(current) != len(cache):
+        _save_cache(known_faces_dir, current)
+
+    names = [os.path.splitext(filename)[0] for filename in sorted(current)]
+    publish_known_faces([current[filename][1] for filename in sorted(current)], names)
+    print(f"[INFO] Loaded {len(names)} known faces ({len(to_encode)} newly encoded)")
+    return len(names)
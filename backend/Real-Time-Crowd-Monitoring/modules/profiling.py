@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+
+PROFILE_MODES = ("trace", "sample", "both")
+
+# The active session, or None. The pipelines only read this one global per stage,
+# so a live camera pays nothing for profiling until a session is started.
+_session = None
+_session_lock = threading.Lock()
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+def frame(pipeline, source_id, frame_number=None):
+    """Context for one frame of a pipeline ("crowd", "face"); stages timed inside it form one timeline row."""
+    session = _session
+    if session is None or not session.tracing:
+        return _NULL
+    return session.frame(pipeline, source_id, frame_number)
+
+
+def stage(name):
+    """Time one stage (model, tracker, imencode...) of the current frame."""
+    session = _session
+    if session is None or not session.tracing:
+        return _NULL
+    return session.stage(name)
+
+
+class _FrameContext:
+    __slots__ = ("session", "record", "start")
+
+    def __init__(self, session, record):
+        self.session = session
+        self.record = record
+
+    def __enter__(self):
+        self.session._local.record = self.record
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record["total_ms"] = (time.perf_counter() - self.start) * 1000.0
+        self.session._local.record = None
+        self.session._add_record(self.record)
+        return False
+
+
+class _StageContext:
+    __slots__ = ("record", "name", "start")
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stages = self.record["stages"]
+        stages[self.name] = stages.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000.0
+        return False
+
+
+def _stats(values):
+    values = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+class ProfileSession:
+    """One profiling run over the live pipelines of the analysis process.
+
+    "trace" records a per-frame timeline of stage durations; "sample" walks the
+    Python stacks of every thread at a fixed interval and counts them as collapsed
+    stacks (one ``thread;module:function;... count`` line each, the input format of
+    flamegraph.pl and speedscope). Results are written to ``output_dir`` on finish.
+    """
+
+    def __init__(self, profile_id, output_dir, seconds, mode="both", source_id=None,
+                 sample_interval=0.005, max_frames=20000):
+        self.profile_id = profile_id
+        self.output_dir = output_dir
+        self.seconds = seconds
+        self.mode = mode
+        self.source_id = source_id
+        self.sample_interval = sample_interval
+        self.max_frames = max_frames
+        self.tracing = mode in ("trace", "both")
+        self.sampling = mode in ("sample", "both")
+
+        self._local = threading.local()
+        self._records = []
+        self._records_lock = threading.Lock()
+        self._stacks = Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._closed = False
+        self.started = None
+
+    def frame(self, pipeline, source_id, frame_number=None):
+        if self.source_id is not None and source_id != self.source_id:
+            return _NULL
+        record = {
+            "pipeline": pipeline,
+            "source": source_id,
+            "frame": frame_number,
+            "t": round(time.time() - self.started, 6),
+            "stages": {},
+        }
+        return _FrameContext(self, record)
+
+    def stage(self, name):
+        record = getattr(self._local, "record", None)
+        if record is None:
+            return _NULL  # Not inside a traced frame (other source, or a helper thread)
+        return _StageContext(record, name)
+
+    def _add_record(self, record):
+        with self._records_lock:
+            if not self._closed and len(self._records) < self.max_frames:
+                self._records.append(record)
+
+    def _sample_loop(self):
+        names = {}
+        while not self._stop.wait(self.sample_interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, top in sys._current_frames().items():
+                name = names.get(ident, f"thread-{ident}")
+                if name.startswith("profile-"):
+                    continue  # This session's own threads
+                stack = []
+                while top is not None:
+                    code = top.f_code
+                    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                    stack.append(f"{module}:{code.co_name}")
+                    top = top.f_back
+                stack.append(name)
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def run(self):
+        """Collect for ``seconds`` (blocking)."""
+        if self.started is None:
+            self.started = time.time()
+        sampler = None
+        if self.sampling:
+            sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            sampler.start()
+        self._stop.wait(self.seconds)
+        self._stop.set()
+        if sampler is not None:
+            sampler.join()
+
+    def close(self):
+        """Stop accepting frames (some may still be in flight) and write the results."""
+        with self._records_lock:
+            self._closed = True
+        return self._write()
+
+    def summary(self):
+        """Frame rate and per-stage timings of each pipeline on each source.
+
+        ``{"pipelines": {pipeline: {source: {"frames", "fps", "stages"}}}}``: the crowd
+        and face pipelines of one source are reported apart, as their frames and
+        stages (both have an ``imencode``) have nothing to do with each other.
+        """
+        with self._records_lock:
+            records = list(self._records)
+        durations = defaultdict(lambda: defaultdict(list))
+        for record in records:
+            stages = durations[(record["pipeline"], record["source"])]
+            stages["total"].append(record["total_ms"])
+            for name, ms in record["stages"].items():
+                stages[name].append(ms)
+        pipelines = defaultdict(dict)
+        for (pipeline, source), stages in durations.items():
+            pipelines[pipeline][source] = {
+                "frames": len(stages["total"]),
+                "fps": round(len(stages["total"]) / self.seconds, 2),
+                "stages": {name: _stats(values) for name, values in stages.items()},
+            }
+        return {
+            "frames": len(records),
+            "pipelines": dict(pipelines),
+            "samples": self._samples,
+        }
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.profile_id)
+        if self.sampling:
+            with open(base + ".collapsed", "w", encoding="utf-8") as collapsed:
+                for stack, count in self._stacks.most_common():
+                    collapsed.write(f"{stack} {count}\n")
+        if self.tracing:
+            for record in self._records:
+                record["total_ms"] = round(record["total_ms"], 3)
+                record["stages"] = {name: round(ms, 3) for name, ms in record["stages"].items()}
+            with open(base + ".timeline.json", "w", encoding="utf-8") as timeline:
+                json.dump({"started": self.started, "seconds": self.seconds, "frames": self._records}, timeline)
+        return self.summary()
+
+
+def start(profile_id, output_dir, seconds, mode="both", source_id=None, sample_interval=0.005,
+          on_done=None):
+    """Start a profiling session in the background. Returns False if one is already running.
+
+    ``on_done(summary, error)`` is called from the session thread when it finishes.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            return False
+        session = ProfileSession(profile_id, output_dir, seconds, mode, source_id, sample_interval)
+        session.started = time.time()
+        _session = session
+
+    def run():
+        global _session
+        summary, error = None, None
+        try:
+            session.run()
+        finally:
+            with _session_lock:
+                _session = None
+        try:
+            summary = session.close()
+        except Exception as e:
+            error = str(e)
+            print(f"Error in profiling session {profile_id}: {e}")
+        if on_done is not None:
+            on_done(summary, error)
+
+    threading.Thread(target=run, name=f"profile-{profile_id}", daemon=True).start()
+    return True
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from state import os_thread_local
+
+_COLUMNS = ("id", "name", "confidence", "source", "timestamp", "box", "thumbnail")
+
+
+def _row_to_record(row):
+    record = dict(zip(_COLUMNS, row))
+    record["box"] = json.loads(record["box"])
+    record["thumbnail"] = bool(record["thumbnail"])
+    return record
+
+
+class SightingLog:
+    """Record every watchlist match together with a cropped face thumbnail.
+
+    Sighting metadata is kept in an SQLite table (``index.db``, indexed by time and by
+    name) shared by every process, and thumbnails as JPEG files under ``store_dir``.
+    Lookups and pages are read from the table, so no process holds the history in
+    memory; only recently used thumbnails are cached, in a bounded LRU. Cropping and
+    encoding happen on a background thread, started with the first sighting recorded
+    in the process, so the frame loop only pays for a small copy of the face region.
+    """
+
+    def __init__(self, store_dir, dedup_seconds=10.0, cache_size=256, thumbnail_size=(112, 112), margin=0.25):
+        self.store_dir = store_dir
+        self.thumbs_dir = os.path.join(store_dir, "thumbs")
+        self.db_path = os.path.join(store_dir, "index.db")
+        self.dedup_seconds = dedup_seconds
+        self.cache_size = cache_size
+        self.thumbnail_size = thumbnail_size
+        self.margin = margin
+
+        os.makedirs(self.thumbs_dir, exist_ok=True)
+
+        self._local = os_thread_local()
+        self._lock = threading.Lock()
+        self._last_seen = {}     # (name, source) -> timestamp of the last recorded sighting
+        self._thumbnails = OrderedDict()  # sighting id -> JPEG bytes (LRU)
+        self._queue = queue.Queue()
+        self._worker = None
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sightings ("
+            "id TEXT PRIMARY KEY, name TEXT, confidence, source TEXT, timestamp REAL NOT NULL, box TEXT, "
+            "thumbnail INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sightings_time ON sightings (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sightings_name_time ON sightings (name, timestamp)")
+
+    def _connection(self):
+        # One connection per thread and per process, as in StateStore
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, name, confidence, source, frame, box):
+        """Queue a sighting of ``name`` at ``box`` = (top, right, bottom, left) in ``frame``.
+
+        Returns the new sighting id, or None if the same identity was already recorded
+        from this source within the de-duplication window.
+        """
+        now = time.time()
+        key = (name, source)
+        with self._lock:
+            last = self._last_seen.get(key)
+            if last is not None and now - last < self.dedup_seconds:
+                return None
+            self._last_seen[key] = now
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._encode_worker, name="sighting-encoder", daemon=True)
+                self._worker.start()
+
+        # Copy only the padded face region; the caller keeps drawing on the frame
+        top, right, bottom, left = box
+        pad_y = int((bottom - top) * self.margin)
+        pad_x = int((right - left) * self.margin)
+        height, width = frame.shape[:2]
+        crop = frame[max(0, top - pad_y):min(height, bottom + pad_y),
+                     max(0, left - pad_x):min(width, right + pad_x)].copy()
+
+        record = {
+            "id": uuid.uuid4().hex[:16],
+            "name": name,
+            "confidence": confidence,
+            "source": source,
+            "timestamp": now,
+            "box": [int(top), int(right), int(bottom), int(left)],
+        }
+        self._queue.put((record, crop))
+        return record["id"]
+
+    def _encode_worker(self):
+        while True:
+            record, crop = self._queue.get()
+            try:
+                self._store(record, crop)
+            except Exception as e:
+                print(f"Error storing sighting {record['id']}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _store(self, record, crop):
+        thumbnail = None
+        if crop.size:
+            crop = cv2.resize(crop, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode(".jpg", crop)
+            if ret:
+                thumbnail = buffer.tobytes()
+                with open(os.path.join(self.thumbs_dir, f"{record['id']}.jpg"), "wb") as thumb_file:
+                    thumb_file.write(thumbnail)
+        record["thumbnail"] = thumbnail is not None
+
+        self._connection().execute(
+            f"INSERT INTO sightings VALUES ({','.join('?' * len(_COLUMNS))})",
+            tuple(json.dumps(record["box"]) if column == "box" else record[column] for column in _COLUMNS),
+        )
+        if thumbnail is not None:
+            with self._lock:
+                self._cache_thumbnail(record["id"], thumbnail)
+
+    def _cache_thumbnail(self, sighting_id, thumbnail):
+        self._thumbnails[sighting_id] = thumbnail
+        self._thumbnails.move_to_end(sighting_id)
+        while len(self._thumbnails) > self.cache_size:
+            self._thumbnails.popitem(last=False)
+
+    def get(self, sighting_id):
+        """Return the metadata of one sighting, or None if unknown (or not yet stored)."""
+        row = self._connection().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM sightings WHERE id = ?", (sighting_id,)
+        ).fetchone()
+        return _row_to_record(row) if row else None
+
+    def get_thumbnail(self, sighting_id):
+        """Return the JPEG thumbnail of a sighting from the cache or the on-disk store."""
+        with self._lock:
+            thumbnail = self._thumbnails.get(sighting_id)
+            if thumbnail is not None:
+                self._thumbnails.move_to_end(sighting_id)
+                return thumbnail
+        record = self.get(sighting_id)
+        if record is None or not record["thumbnail"]:
+            return None
+
+        path = os.path.join(self.thumbs_dir, f"{sighting_id}.jpg")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as thumb_file:
+            thumbnail = thumb_file.read()
+        with self._lock:
+            self._cache_thumbnail(sighting_id, thumbnail)
+        return thumbnail
+
+    def query(self, name=None, since=None, until=None, page=1, per_page=50):
+        """Return one page of sightings, newest first, filtered by name and time range."""
+        conditions, params = [], []
+        if name is not None:
+            conditions.append("name = ?")
+            params.append(name)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        page = max(1, page)
+        conn = self._connection()
+        conn.execute("BEGIN")  # Count and page from the same snapshot
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM sightings {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM sightings {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                params + [per_page, (page - 1) * per_page],
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return {
+            "items": [_row_to_record(row) for row in rows],
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+        }
+
+    def reset_dedup(self):
+        """Forget the de-duplication windows so the next match of everyone is recorded."""
+        with self._lock:
+            self._last_seen.clear()
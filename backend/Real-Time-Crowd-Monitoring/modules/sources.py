@@ -0,0 +1,520 @@
+import time
+import threading
+import cv2
+from frame_index import FrameIndex
+from frame_pool import FramePool
+
+
+DECODE_MODES = ("full", "grab", "keyframe", "auto")
+
+
+def parse_uri(uri):
+    """Webcam indices may arrive as strings ("0"); files and RTSP URLs stay as they are."""
+    if isinstance(uri, str) and uri.isdigit():
+        return int(uri)
+    return uri
+
+
+def source_kind(uri):
+    if isinstance(uri, int):
+        return "webcam"
+    if "://" in uri:
+        return "stream"
+    return "file"
+
+
+class VideoSource:
+    """One webcam, video file or RTSP stream decoded on its own thread.
+
+    The decoder keeps only the newest frame; consumers that fall behind skip ahead
+    instead of queueing. Lost connections are retried with exponential backoff.
+
+    Decode modes (for overloaded nodes):
+      full      retrieve every frame
+      grab      grab every frame, retrieve only every ``retrieve_every``-th
+      keyframe  grab every frame, retrieve only keyframes (falls back to ``grab``
+                when the backend cannot report keyframes, see below)
+      auto      grab every frame, retrieve only once consumers took the previous one
+
+    OpenCV's FFmpeg backend still decodes on grab(); skipping retrieve() saves the
+    colour conversion and the frame copy, which dominate at high resolutions.
+
+    Only the FFmpeg backend flags keyframes (webcam backends such as V4L2 or MSMF
+    report 0 or -1 forever), and its flag describes the last demuxed packet, so for
+    streams with decoder delay the retrieved frame may trail the keyframe slightly.
+    Keyframe mode is therefore only used on FFmpeg captures and falls back to
+    ``grab`` if no keyframe shows up within ``keyframe_probe_grabs`` grabs of opening.
+    File sources take keyframe positions from their FrameIndex instead.
+
+    Frames are retrieved into a pool of buffers at the source's resolution, so a
+    steady stream allocates no new frame memory. The newest-frame slot and every
+    consumer currently holding a frame each own a reference to its buffer.
+    """
+
+    def __init__(self, source_id, uri, decode_mode="full", retrieve_every=5,
+                 backoff_initial=0.5, backoff_max=30.0, max_failures=10, pool_size=8, keyframe_probe_grabs=300):
+        if decode_mode not in DECODE_MODES:
+            raise ValueError(f"Unknown decode mode: {decode_mode}")
+        self.source_id = source_id
+        self.uri = parse_uri(uri)
+        self.kind = source_kind(self.uri)
+        self.decode_mode = decode_mode
+        self.retrieve_every = max(1, int(retrieve_every))
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_failures = max_failures
+        self.keyframe_probe_grabs = keyframe_probe_grabs
+        self.keyframe_fallback = False  # keyframe mode running as grab (decided per open)
+        self._keyframe_probe_until = None  # Grab count by which a keyframe must have been seen
+
+        self.pool = FramePool(max_buffers=pool_size)
+        self._frame_shape = None  # Resolution of the last retrieved frame
+        self._frame = None
+        self._frame_number = 0
+        self._seq = 0
+        self._consumers = {}  # One entry per frames() consumer: seq of the last frame it took
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"source-{source_id}", daemon=True)
+
+        self.status = "starting"
+        self.reconnects = 0
+        self.last_error = None
+        self.last_frame_at = None
+        self.last_grab_at = None
+        self._grabbed = 0
+        self._retrieved = 0
+        self._rate_window_start = time.time()
+        self._rate_grabbed = 0
+        self._rate_retrieved = 0
+        self.decode_fps = 0.0
+        self.fps = 0.0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _open(self):
+        if self.kind == "stream":
+            capture = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
+        else:
+            capture = cv2.VideoCapture(self.uri)
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Live sources: never serve stale buffered frames
+        return capture
+
+    def _run(self):
+        backoff = self.backoff_initial
+        while not self._stopped.is_set():
+            self.status = "connecting" if self.reconnects == 0 else "reconnecting"
+            capture = self._open()
+            if not capture.isOpened():
+                self.last_error = "open failed"
+            else:
+                if self._decode(capture):
+                    backoff = self.backoff_initial  # Delivered frames: the next outage starts from scratch
+            capture.release()
+            if self._stopped.is_set():
+                break
+
+            self.reconnects += 1
+            self.status = "reconnecting"
+            print(f"[WARN] Source {self.source_id} lost ({self.last_error}), retrying in {backoff:.1f}s")
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+        self.status = "stopped"
+
+    def _probe_keyframes(self, capture):
+        """Decide on opening whether ``capture`` can drive keyframe mode."""
+        if self.decode_mode != "keyframe":
+            return
+        has_key_frame = getattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME", None)
+        try:
+            supported = has_key_frame is not None and capture.getBackendName() == "FFMPEG"
+        except cv2.error:
+            supported = False
+        self.keyframe_fallback = not supported
+        self._keyframe_probe_until = self._grabbed + self.keyframe_probe_grabs if supported else None
+        if not supported:
+            print(f"[WARN] Source {self.source_id} cannot report keyframes; decoding in grab mode")
+
+    def _decode(self, capture):
+        """Read frames until the source fails; returns True if any frame was delivered."""
+        delivered = False
+        consecutive_failures = 0
+        self._probe_keyframes(capture)
+
+        while not self._stopped.is_set():
+            if not capture.grab():
+                consecutive_failures += 1
+                if consecutive_failures > self.max_failures:
+                    self.last_error = "read failed"
+                    return delivered
+                continue
+            consecutive_failures = 0
+            self.last_grab_at = time.time()
+            self._grabbed += 1
+            self._rate_grabbed += 1
+
+            if self._should_retrieve(capture):
+                success, frame = self._retrieve(capture)
+                if success:
+                    self._publish(frame)
+                    delivered = True
+                    self.status = "live"
+            self._update_rates()
+        return delivered
+
+    def _retrieve(self, capture):
+        """retrieve() into a free pooled buffer of the source's resolution (owned by the caller)."""
+        buffer = self.pool.acquire(self._frame_shape) if self._frame_shape is not None else None
+        success, frame = capture.retrieve(buffer)
+        if not success or frame is not buffer:
+            self.pool.release(buffer)
+        if success and frame is not buffer:
+            self._frame_shape = frame.shape  # First frame, or the resolution changed
+        return success, frame
+
+    def _should_retrieve(self, capture):
+        if self.decode_mode == "full":
+            return True
+        if self.decode_mode == "keyframe" and not self.keyframe_fallback:
+            if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0:
+                self._keyframe_probe_until = None  # Supported: keep using it
+                return True
+            if self._keyframe_probe_until is not None and self._grabbed >= self._keyframe_probe_until:
+                self.keyframe_fallback = True
+                print(f"[WARN] Source {self.source_id} reported no keyframe in {self.keyframe_probe_grabs} "
+                      f"frames; decoding in grab mode")
+            return False
+        if self.decode_mode in ("grab", "keyframe"):
+            return self._grabbed % self.retrieve_every == 0
+        # auto: only pay for retrieve() once every consumer took the previous frame
+        with self._cond:
+            return self._all_consumed()
+
+    def _all_consumed(self):
+        """Whether every registered consumer has taken the newest frame (call under _cond)."""
+        return all(seen == self._seq for seen in self._consumers.values())
+
+    def _publish(self, frame, number=None):
+        """Make ``frame`` the newest frame; the source's reference moves from the previous one to it."""
+        with self._cond:
+            self.pool.release(self._frame)
+            self._frame = frame
+            self._seq += 1
+            self._frame_number = self._seq if number is None else number
+            self._retrieved += 1
+            self._rate_retrieved += 1
+            self.last_frame_at = time.time()
+            self._cond.notify_all()
+
+    def _update_rates(self):
+        now = time.time()
+        elapsed = now - self._rate_window_start
+        if elapsed >= 1.0:
+            self.decode_fps = self._rate_grabbed / elapsed
+            self.fps = self._rate_retrieved / elapsed
+            self._rate_grabbed = self._rate_retrieved = 0
+            self._rate_window_start = now
+
+    def frames(self, copy=True, numbered=False):
+        """Return an iterator over every new frame until the source is stopped.
+
+        The consumer is registered right away (not on the first ``next()``), so a
+        lockstep file source started afterwards waits for it from the first frame.
+        Consumers that draw on the frame in place need ``copy=True`` (copies come
+        from the source's buffer pool too). A yielded frame stays valid until the
+        consumer asks for the next one (or closes the iterator); it must not be kept
+        beyond that without copying. With
+        ``numbered=True`` items are ``(frame_number, frame)``; for files the number is
+        the frame's position in the file, for live sources a running count.
+        """
+        token = object()
+        with self._cond:
+            self._consumers[token] = 0
+            self._cond.notify_all()
+        return self._consume(token, copy, numbered)
+
+    def _consume(self, token, copy, numbered):
+        seen = 0
+        frame = None  # The pooled buffer this consumer holds a reference to
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != seen or self._stopped.is_set(), timeout=1.0)
+                    if self._seq == seen:
+                        continue
+                    self.pool.release(frame)  # Done with the previous frame
+                    frame = self.pool.retain(self._frame)  # Not reused while we hold it
+                    number, seen = self._frame_number, self._seq
+                    self._consumers[token] = seen
+                    self._cond.notify_all()  # Wake a lockstep file decoder waiting for consumers
+                if copy:
+                    source_frame, frame = frame, self.pool.copy(frame)
+                    self.pool.release(source_frame)
+                yield (number, frame) if numbered else frame
+        finally:
+            self.pool.release(frame)
+            with self._cond:
+                del self._consumers[token]
+                self._cond.notify_all()
+
+    def health(self):
+        stale = self.last_grab_at is None or time.time() - self.last_grab_at > 5
+        return {
+            "uri": self.uri,
+            "kind": self.kind,
+            "status": self.status,
+            "healthy": self.status == "live" and not stale,
+            "decode_mode": self.decode_mode,
+            "keyframe_fallback": self.keyframe_fallback,
+            "fps": round(self.fps, 1),
+            "decode_fps": round(self.decode_fps, 1),
+            "frame_number": self._frame_number,
+            "frames_grabbed": self._grabbed,
+            "frames_retrieved": self._retrieved,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "last_frame_at": self.last_frame_at,
+            "buffer_pool": self.pool.stats(),
+        }
+
+
+class FileSource(VideoSource):
+    """A recorded video replayed through its FrameIndex.
+
+    Seeks jump to the nearest keyframe before the target and only grab (never
+    retrieve) up to it, so frames before that keyframe are never decoded. Playback is
+    paced to the wall clock using the file's own timestamps: ``speed`` 1.0 is real
+    time, 4.0 four times faster, and 0 delivers every frame in lockstep with the
+    consumers (nothing dropped), for reproducible offline runs and benchmarks.
+    """
+
+    def __init__(self, source_id, uri, index_dir, speed=1.0, loop=True, start=0.0, **kwargs):
+        super().__init__(source_id, uri, **kwargs)
+        self.index_dir = index_dir
+        self.speed = max(0.0, float(speed))
+        self.loop = loop
+        self.index = None
+        self._keyframes = None  # Keyframe numbers from the index, for keyframe mode
+        self.position = 0  # Number of the next frame to grab
+        self._seek_seconds = float(start) if start else None
+        self._seek_frame = None
+        self._seek_requested = threading.Event()
+
+    def seek(self, seconds=None, frame=None):
+        """Jump to a time (seconds) or a frame number; applied by the decoder thread."""
+        with self._cond:
+            self._seek_seconds, self._seek_frame = seconds, frame
+            self._seek_requested.set()
+            self._cond.notify_all()
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
+        if self.index is None and capture.isOpened():
+            self.status = "indexing"
+            try:
+                self.index = FrameIndex.load_or_build(self.uri, self.index_dir)
+            except IOError as e:
+                self.last_error = str(e)
+                capture.release()
+                return capture
+        if self.index is not None:
+            self._keyframes = frozenset(self.index.keyframes.tolist()) if self.index.keyframes_known else None
+            self.keyframe_fallback = self.decode_mode == "keyframe" and self._keyframes is None
+        return capture
+
+    def _should_retrieve(self, capture):
+        if self.decode_mode == "keyframe" and self._keyframes is not None:
+            return self.position - 1 in self._keyframes  # The frame just grabbed
+        return super()._should_retrieve(capture)
+
+    def _seek_to(self, capture, target):
+        """Position ``capture`` so the next grab() returns frame ``target``."""
+        target = min(max(int(target), 0), max(self.index.frame_count - 1, 0))
+        keyframe = self.index.keyframe_before(target)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        for _ in range(target - keyframe):
+            if not capture.grab():  # Skipped frames are grabbed, never retrieved
+                break
+        self.position = target
+
+    def _pending_seek(self):
+        with self._cond:
+            if not self._seek_requested.is_set():
+                return None
+            self._seek_requested.clear()
+            seconds, frame = self._seek_seconds, self._seek_frame
+            self._seek_seconds = self._seek_frame = None
+        if frame is not None:
+            return frame
+        return self.index.frame_at(seconds or 0.0)
+
+    def _decode(self, capture):
+        if self.index is None or not self.index.frame_count:
+            return False
+        if self._seek_seconds is not None or self._seek_frame is not None:
+            self._seek_requested.set()  # Start offset from the spec (or a seek made while reconnecting)
+        if not self._seek_requested.is_set() and self.position:
+            self._seek_to(capture, self.position)  # Reconnected: carry on where we were
+        delivered = False
+        consecutive_failures = 0
+        clock_start, media_start = time.time(), float(self.index.timestamps[self.position])
+
+        while not self._stopped.is_set():
+            target = self._pending_seek()
+            if target is not None:
+                self._seek_to(capture, target)
+                clock_start, media_start = time.time(), float(self.index.timestamps[self.position])
+
+            if self.position >= self.index.frame_count:
+                if not self.loop:
+                    self.status = "finished"
+                    self._seek_requested.wait()  # Idle until seeked back or removed
+                    continue
+                self._seek_to(capture, 0)
+                clock_start, media_start = time.time(), 0.0
+                continue
+            if not capture.grab():
+                # Not the end of the file (the index knows where that is): a read error.
+                # Reopen through _run's backoff, resuming at this position.
+                consecutive_failures += 1
+                if consecutive_failures > self.max_failures:
+                    self.last_error = "read failed"
+                    return delivered
+                continue
+            consecutive_failures = 0
+
+            number = self.position
+            self.position += 1
+            self.last_grab_at = time.time()
+            self._grabbed += 1
+            self._rate_grabbed += 1
+
+            if self.speed == 0:
+                # Lockstep: hand over the next frame only once every consumer took the last one
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: (self._consumers and self._all_consumed()) or self._stopped.is_set()
+                        or self._seek_requested.is_set()
+                    )
+                if self._seek_requested.is_set():
+                    continue  # Drop the frame grabbed before the seek
+            else:
+                media_time = float(self.index.timestamps[min(number, self.index.frame_count - 1)])
+                due = clock_start + (media_time - media_start) / self.speed
+                delay = due - time.time()
+                if delay > 0:
+                    self._stopped.wait(delay)
+
+            if self.speed == 0 or self._should_retrieve(capture):
+                success, frame = self._retrieve(capture)
+                if success:
+                    self._publish(frame, number)
+                    delivered = True
+                    self.status = "live"
+            self._update_rates()
+        return delivered
+
+    def stop(self):
+        super().stop()
+        self._seek_requested.set()  # Release a finished, idle decoder
+
+    def health(self):
+        health = super().health()
+        if self.status == "finished":
+            health["healthy"] = True
+        health.update({
+            "speed": self.speed,
+            "loop": self.loop,
+            "position": round(float(self.index.timestamps[min(self.position, self.index.frame_count - 1)]), 3)
+            if self.index is not None and self.index.frame_count else 0.0,
+            "index": self.index.summary() if self.index is not None else None,
+        })
+        return health
+
+
+class SourceManager:
+    """Registry of running sources; sources can be added and removed at runtime."""
+
+    def __init__(self, index_dir, on_start=None):
+        self.index_dir = index_dir  # Where FileSource caches frame indexes
+        self.on_start = on_start  # Called with each new source just before it starts (e.g. to attach a pipeline)
+        self._sources = {}
+        self._specs = {}
+        self._lock = threading.Lock()
+
+    def add(self, source_id, spec):
+        """Start a source from a spec dict: {"uri": ..., "decode_mode": ..., "retrieve_every": ...}.
+
+        File sources also take "speed", "loop" and "start" (seconds).
+        """
+        options = {
+            "decode_mode": spec.get("decode_mode", "full"),
+            "retrieve_every": spec.get("retrieve_every", 5),
+        }
+        if source_kind(parse_uri(spec["uri"])) == "file":
+            source = FileSource(
+                source_id,
+                spec["uri"],
+                self.index_dir,
+                speed=spec.get("speed", 1.0),
+                loop=spec.get("loop", True),
+                start=spec.get("start", 0.0),
+                **options,
+            )
+        else:
+            source = VideoSource(source_id, spec["uri"], **options)
+        with self._lock:
+            if source_id in self._sources:
+                raise ValueError(f"Source {source_id} already exists")
+            self._sources[source_id] = source
+            self._specs[source_id] = dict(spec)
+        if self.on_start is not None:
+            self.on_start(source)  # Consumers register before the first frame is decoded
+        source.start()
+        print(f"[INFO] Source {source_id} started ({source.kind}: {source.uri}, mode={source.decode_mode})")
+        return source
+
+    def remove(self, source_id):
+        with self._lock:
+            source = self._sources.pop(source_id, None)
+            self._specs.pop(source_id, None)
+        if source is not None:
+            source.stop()
+            print(f"[INFO] Source {source_id} removed")
+
+    def get(self, source_id):
+        with self._lock:
+            return self._sources.get(source_id)
+
+    def sync(self, specs):
+        """Start, restart or stop sources so the running set matches ``specs``."""
+        with self._lock:
+            running = dict(self._specs)
+        for source_id in running:
+            if source_id not in specs or specs[source_id] != running[source_id]:
+                self.remove(source_id)
+        for source_id, spec in specs.items():
+            if self.get(source_id) is None:
+                try:
+                    self.add(source_id, spec)
+                except ValueError as e:
+                    print(f"Error starting source {source_id}: {e}")
+
+    def seek(self, source_id, seconds=None, frame=None):
+        source = self.get(source_id)
+        if not isinstance(source, FileSource):
+            return False
+        source.seek(seconds=seconds, frame=frame)
+        return True
+
+    def health(self):
+        with self._lock:
+            sources = dict(self._sources)
+        return {source_id: source.health() for source_id, source in sources.items()}
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+
+_UPSERT = (
+    "INSERT INTO state (key, value, version, updated) VALUES (?, ?, 1, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = state.version + 1, updated = excluded.updated"
+)
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return sqlite3.Binary(value)
+    return json.dumps(value)
+
+
+def _decode(raw):
+    if isinstance(raw, str):
+        return json.loads(raw)
+    return raw  # bytes blob or None
+
+
+def os_thread_local():
+    """A ``threading.local`` per OS thread, even once gevent has patched ``threading``.
+
+    Under gevent (serve.py) the patched ``threading.local`` is per greenlet, so every
+    request would open its own SQLite connection. Greenlets of one thread can share a
+    connection: they only switch on I/O, never inside a transaction.
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is not None and monkey.is_module_patched("threading"):
+        return monkey.get_original("threading", "local")()
+    return threading.local()
+
+
+class StateStore:
+    """Key-value store shared by every process on the node, backed by one SQLite file.
+
+    SQLite in WAL mode gives atomic multi-key writes and consistent snapshot reads
+    across processes without running a separate server: the analysis process writes,
+    any number of API worker processes read. Values are JSON unless they are bytes,
+    which are stored as blobs (JPEG frames, face encodings). Every key carries a
+    version that is bumped on each write so readers can poll cheaply for changes.
+
+    Writes are not synced to disk per commit (WAL with synchronous=NORMAL), which keeps
+    publishing frames cheap; a power loss may lose the last writes but never corrupts
+    the file. Writes touching a ``persistent`` key (a name, or the name of a
+    ``name:<suffix>`` family such as ``count_lines``) are synced before they return.
+    """
+
+    def __init__(self, path, persistent=()):
+        self.path = path
+        self.persistent = frozenset(persistent)
+        self._local = os_thread_local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, value, version INTEGER NOT NULL DEFAULT 0, updated REAL)"
+        )
+
+    def _connection(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _is_persistent(self, keys):
+        return any(key.split(":", 1)[0] in self.persistent for key in keys)
+
+    def _begin(self, conn, keys):
+        conn.execute("PRAGMA synchronous=FULL" if self._is_persistent(keys) else "PRAGMA synchronous=NORMAL")
+        conn.execute("BEGIN IMMEDIATE")
+
+    def set_many(self, values):
+        """Write several keys in one transaction; readers see all or none of them."""
+        conn = self._connection()
+        now = time.time()
+        self._begin(conn, values)
+        try:
+            conn.executemany(_UPSERT, [(key, _encode(value), now) for key, value in values.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, key, function, default=None):
+        """Atomically replace the value of ``key`` with ``function(old_value)`` and return it.
+
+        The read and the write happen in one write transaction, so concurrent updates
+        from several processes never lose each other's changes.
+        """
+        return self.update_many([key], lambda values: {key: function(values[key])}, {key: default})[key]
+
+    def update_many(self, keys, function, defaults=None):
+        """Like update() for several keys: ``function`` gets and returns a dict of values.
+
+        The write is synced if one of ``keys`` is persistent (list a persistent key among
+        ``keys`` when ``function`` may add one).
+        """
+        defaults = defaults or {}
+        conn = self._connection()
+        self._begin(conn, keys)
+        try:
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key, value FROM state WHERE key IN ({placeholders})", list(keys)
+            ).fetchall()
+            found = {key: _decode(raw) for key, raw in rows}
+            values = function({key: found.get(key, defaults.get(key)) for key in keys})
+            now = time.time()
+            conn.executemany(_UPSERT, [(key, _encode(value), now) for key, value in values.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return values
+
+    def incr(self, key, amount=1):
+        """Atomically add ``amount`` to a numeric key and return the new value."""
+        return self.update(key, lambda value: value + amount, default=0)
+
+    def keys(self):
+        return [row[0] for row in self._connection().execute("SELECT key FROM state")]
+
+    def get(self, key, default=None):
+        row = self._connection().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else _decode(row[0])
+
+    def snapshot(self, keys, defaults=None):
+        """Read several keys atomically; missing keys take their value from ``defaults``."""
+        defaults = defaults or {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM state WHERE key IN ({placeholders})", list(keys)
+        ).fetchall()
+        found = {key: _decode(raw) for key, raw in rows}
+        return {key: found.get(key, defaults.get(key)) for key in keys}
+
+    def get_if_newer(self, key, version):
+        """Return ``(value, version)`` if ``key`` changed since ``version``, else ``(None, version)``."""
+        row = self._connection().execute(
+            "SELECT value, version FROM state WHERE key = ? AND version > ?", (key, version)
+        ).fetchone()
+        if row is None:
+            return None, version
+        return _decode(row[0]), row[1]
+
+    def iter_updates(self, key, poll_interval=0.01):
+        """Yield the value of ``key`` every time it is rewritten (used for published frames)."""
+        version = 0
+        while True:
+            value, version_now = self.get_if_newer(key, version)
+            if value is None:
+                time.sleep(poll_interval)
+                continue
+            version = version_now
+            yield value
@@ -0,0 +1,106 @@
+import json
+import time
+import threading
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+SSE_MIMETYPE = 'text/event-stream'
+
+
+def multipart_stream(jpegs):
+    """Yield JPEG frames as a multipart/x-mixed-replace body.
+
+    Each frame is yielded as its own chunk after a small part header, so the JPEG
+    read from the store is written to the socket as-is instead of being copied into
+    a new header + frame + trailer bytes object for every viewer. The part header
+    carries the CRLF that ends the previous part (a leading CRLF before the first
+    boundary is allowed preamble) and a Content-Length so clients can show a frame
+    without waiting for the next boundary.
+    """
+    for jpeg in jpegs:
+        yield b'\r\n--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(jpeg)
+        yield jpeg
+
+
+def event_stream(events):
+    """Yield JSON-serialisable values as a text/event-stream (Server-Sent Events) body."""
+    for event in events:
+        yield "data: %s\n\n" % json.dumps(event)
+
+
+class FramePublisher:
+    """Fan out the frames published under one store key to every viewer in this process.
+
+    Any published value works, not only JPEGs (the /events push channel uses it too).
+
+    A single poller reads the store and keeps only the newest frame; viewers wait on
+    a condition for the next one, so the cost of polling does not grow with the
+    number of viewers and a slow viewer skips frames instead of queueing them. The
+    poller starts with the first viewer and stops ``idle_timeout`` seconds after the
+    last one leaves. Under gevent (serve.py, gunicorn -k gevent) the poller and every
+    viewer are greenlets, so a viewer costs a few KB instead of a thread.
+    """
+
+    def __init__(self, state, key, poll_interval=0.01, idle_timeout=30.0):
+        self.state = state
+        self.key = key
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.viewers = 0
+        self._frame = None
+        self._version = 0
+        self._cond = threading.Condition()
+        self._poller = None
+        self._last_viewer_at = time.time()
+
+    def _poll(self):
+        version = 0
+        while True:
+            frame, new_version = self.state.get_if_newer(self.key, version)
+            with self._cond:
+                if frame is not None:
+                    version = new_version
+                    self._frame, self._version = frame, new_version
+                    self._cond.notify_all()
+                if not self.viewers and time.time() - self._last_viewer_at > self.idle_timeout:
+                    self._poller = None
+                    return
+            time.sleep(self.poll_interval)
+
+    def frames(self):
+        """Yield each new frame until the viewer disconnects (the generator is closed)."""
+        with self._cond:
+            self.viewers += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name=f"publisher-{self.key}", daemon=True)
+                self._poller.start()
+        try:
+            seen = 0
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._version != seen, timeout=1.0)
+                    if self._version == seen:
+                        continue
+                    frame, seen = self._frame, self._version
+                yield frame
+        finally:
+            with self._cond:
+                self.viewers -= 1
+                self._last_viewer_at = time.time()
+
+
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+def get_publisher(state, key):
+    """The process-wide publisher of ``key`` (one poller per key, whatever the viewer count)."""
+    with _publishers_lock:
+        publisher = _publishers.get(key)
+        if publisher is None:
+            publisher = _publishers[key] = FramePublisher(state, key)
+        return publisher
+
+
+def publisher_stats():
+    with _publishers_lock:
+        return {key: publisher.viewers for key, publisher in _publishers.items()}
@@ -0,0 +1,42 @@
+import sys
+import os
+import argparse
+import subprocess
+
+# Asynchronous serving: one gevent process where every MJPEG viewer and every JSON
+# request is a greenlet instead of a thread, so hundreds of viewers share one event
+# loop (streams read from the per-process FramePublisher, see modules/streaming.py).
+#
+#   python serve.py [--host 0.0.0.0] [--port 5000]
+#
+# The same app under gunicorn (start `python analysis.py` separately):
+#   CROWD_EXTERNAL_ANALYSIS=1 gunicorn -k gevent -w 1 --worker-connections 2000 -b 0.0.0.0:5000 app:app
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API and streams with gevent")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--quiet", action="store_true", help="Do not log every request")
+    args = parser.parse_args()
+
+    # The analysis runs in its own interpreter, started before gevent patches this one:
+    # model inference and decoder threads must stay real threads
+    analysis = None
+    if os.environ.get("CROWD_EXTERNAL_ANALYSIS") != "1":
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        analysis = subprocess.Popen([sys.executable, os.path.join(base_dir, "analysis.py")])
+
+    from gevent import monkey
+    monkey.patch_all()
+
+    from gevent.pywsgi import WSGIServer
+    from app import app
+
+    server = WSGIServer((args.host, args.port), app, log=None if args.quiet else "default")
+    print(f"[INFO] Serving on http://{args.host}:{args.port} (gevent)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if analysis is not None:
+            analysis.terminate()
@@ -7,14 +7,19 @@ export const API_ENDPOINTS = {
   CROWD_COUNT: `${API_BASE_URL}/crowd_count`,
   START_CROWD_COUNT: `${API_BASE_URL}/start_crowd_count`,
   WEAPON_STATUS: `${API_BASE_URL}/weapon_status`,
+  SOURCES: `${API_BASE_URL}/sources`,
+  HEATMAP: `${API_BASE_URL}/heatmap`,
+  EVENTS: `${API_BASE_URL}/events`,  // Server-Sent Events; lines live under SOURCES/<id>/lines
   
   // Face Recognition
   FACE_VIDEO: `${API_BASE_URL}/face_video`,
   TOGGLE_FACE_DETECTION: `${API_BASE_URL}/toggle_face_detection`,
   UPLOAD_FACE: `${API_BASE_URL}/upload_face`,
+  ENROL_FACES: `${API_BASE_URL}/enrol_faces`,
   FACE_MATCH_STATUS: `${API_BASE_URL}/face_match_status`,
   FACE_SCREENSHOT: `${API_BASE_URL}/face_screenshot`,
   SET_FACE_RECOGNITION_METHOD: `${API_BASE_URL}/set_face_recognition_method`,
+  SIGHTINGS: `${API_BASE_URL}/sightings`,
 };
 
 export default API_BASE_URL;